@@ -21,10 +21,15 @@ from AlgorithmImports import *
 import numpy as np
 from math import *
 from scipy import optimize
-from scipy.stats import norm
+from scipy.special import ndtr
 from Logger import *
 from ContractUtils import *
-from fred import fred
+from NumbaKernels import *
+from fred import getRiskFreeRate
+
+# Probability density function of the standard normal distribution (same as scipy.stats.norm.pdf, without the overhead of the generic distribution object)
+def normPdf(x):
+   return np.exp(-0.5 * x * x) * invSqrt2Pi
 
 class BSM:
 
@@ -52,16 +57,15 @@ class BSM:
          self.irLastUpdatedDt = currentDate
 
          # Get the most recent IR as of the current time 
-         ir = fred.query(f"date <= '{currentDate}'").tail(1)
+         ir = getRiskFreeRate(currentDate)
 
          # Check if we found the rate for the given date
-         if ir.empty:
+         if ir == None:
             # Use the default rate
             self.irDate = None
             self.riskFreeRate = self.context.riskFreeRate
          else:
-            irDatetime, self.riskFreeRate = ir[["date", "ir"]].values[0]
-            self.irDate = irDatetime.date()
+            self.irDate, self.riskFreeRate = ir
 
    def isITM(self, contract, spotPrice = None):
       # Get the current price of the underlying unless otherwise specified
@@ -166,10 +170,10 @@ class BSM:
       #Price the option
       if contract.Right == OptionRight.Call:
          # Call Option
-         theoreticalPrice = norm.cdf(d1)*spotPrice - norm.cdf(d2)*Xert
+         theoreticalPrice = ndtr(d1)*spotPrice - ndtr(d2)*Xert
       else:
          # Put Option
-         theoreticalPrice = norm.cdf(-d2)*Xert - norm.cdf(-d1)*spotPrice
+         theoreticalPrice = ndtr(-d2)*Xert - ndtr(-d1)*spotPrice
       return theoreticalPrice
 
 
@@ -193,14 +197,14 @@ class BSM:
       if d2 == None:
          d2 = self.bsmD2(contract, sigma, tau = tau, d1 = d1, ir = ir, spotPrice = spotPrice)
       # -S*N'(d1)*sigma/(2*sqrt(tau))
-      SNs = -(spotPrice * norm.pdf(d1) * sigma) / (2.0 * np.sqrt(tau))
+      SNs = -(spotPrice * normPdf(d1) * sigma) / (2.0 * np.sqrt(tau))
       # r*X*e^(-r*tau)
       rXert = ir * contract.Strike * np.exp(-ir*tau)
       # Compute Theta (divide by the number of trading days to get a daily Theta value)
       if contract.Right == OptionRight.Call:
-         theta = (SNs  -  rXert * norm.cdf(d2))/self.tradingDays
+         theta = (SNs  -  rXert * ndtr(d2))/self.tradingDays
       else:
-         theta = (SNs  +  rXert * norm.cdf(-d2))/self.tradingDays
+         theta = (SNs  +  rXert * ndtr(-d2))/self.tradingDays
       return theta
 
 
@@ -226,9 +230,9 @@ class BSM:
       tXert = tau * ir * contract.Strike * np.exp(-ir*tau)
       # Compute Theta
       if contract.Right == OptionRight.Call:
-         rho = tXert * norm.cdf(d2)
+         rho = tXert * ndtr(d2)
       else:
-         rho = -tXert * norm.cdf(-d2)
+         rho = -tXert * ndtr(-d2)
       return rho
 
 
@@ -247,7 +251,7 @@ class BSM:
       if(sigma == 0 or tau == 0):
          gamma = float('inf')
       else:
-         gamma = norm.pdf(d1) / (spotPrice * sigma * np.sqrt(tau))
+         gamma = normPdf(d1) / (spotPrice * sigma * np.sqrt(tau))
       return gamma
 
 
@@ -264,7 +268,7 @@ class BSM:
       if d1 == None:
          d1 = self.bsmD1(contract, sigma, tau = tau, ir = ir, spotPrice = spotPrice)
       # Compute Vega
-      vega = spotPrice * norm.pdf(d1) * np.sqrt(tau)
+      vega = spotPrice * normPdf(d1) * np.sqrt(tau)
       return vega
 
 
@@ -286,7 +290,7 @@ class BSM:
       if(sigma == 0):
          vomma = float('inf')
       else:
-         vomma = spotPrice * norm.pdf(d1) * np.sqrt(tau) * d1 * d2 / sigma
+         vomma = spotPrice * normPdf(d1) * np.sqrt(tau) * d1 * d2 / sigma
       return vomma
    
    # Compute Implied Volatility from the price of an option
@@ -362,9 +366,9 @@ class BSM:
          
       # Compute option delta (rounded to 2 digits)
       if contract.Right == OptionRight.Call:
-         delta = norm.cdf(d1)
+         delta = ndtr(d1)
       else:
-         delta = -norm.cdf(-d1)
+         delta = -ndtr(-d1)
       return delta
    
    def computeGreeks(self, contract, sigma = None, ir = None, spotPrice = None, atTime = None, saveIt = False):
@@ -373,19 +377,28 @@ class BSM:
       
       # Avoid recomputing the Greeks if we have already done it for this time bar
       if hasattr(contract, "BSMGreeks") and contract.BSMGreeks.lastUpdated == self.context.Time:
+         self.context.executionTimer.stop()
          return contract.BSMGreeks
       
       # Get the DTE as a fraction of a year
       tau = self.optionTau(contract, atTime = atTime)
+
+      # Get the current price of the underlying unless otherwise specified
+      if spotPrice == None:
+         spotPrice = self.contractUtils.getUnderlyingLastPrice(contract)
+
+      # Reuse the Greeks computed at a previous time bar if none of the inputs of the model has changed since then
+      self.setRiskFreeRate()
+      inputs = self.greeksInputs(contract, spotPrice, tau, sigma, self.riskFreeRate if ir == None else ir)
+      greeks = self.getUnchangedGreeks(contract, inputs)
+      if greeks != None:
+         self.context.executionTimer.stop()
+         return greeks
       
       if sigma == None:
          # Compute Implied Volatility
          sigma = self.bsmIV(contract, tau = tau, saveIt = saveIt)
       ### if (sigma == None)
-      
-      # Get the current price of the underlying unless otherwise specified
-      if spotPrice == None:
-         spotPrice = self.contractUtils.getUnderlyingLastPrice(contract)
          
       # Compute D1
       d1 = self.bsmD1(contract, sigma, tau = tau, ir = ir, spotPrice = spotPrice)
@@ -419,9 +432,10 @@ class BSM:
                          , lastUpdated = self.context.Time
                          )
       
-      # Check if we need to save the Greeks as an attribute of the contract object
+      # Check if we need to save the Greeks (and the inputs used to compute them) as an attribute of the contract object
       if saveIt:
          contract.BSMGreeks = greeks
+         contract.BSMInputs = inputs
 
       # Stop the timer
       self.context.executionTimer.stop()
@@ -429,19 +443,29 @@ class BSM:
       return greeks
    
    
+   # Inputs of the BSM model for the given contract: if none of them has changed since the Greeks were last computed (i.e. no new quotes for the contract and its underlying), the Greeks are still the same
+   def greeksInputs(self, contract, spotPrice, tau, sigma, ir):
+      return (spotPrice, self.contractUtils.midPrice(contract), tau, sigma, ir)
+
+   # Returns the Greeks stored on the contract if they have been computed with the same inputs (see greeksInputs), otherwise None
+   def getUnchangedGreeks(self, contract, inputs):
+      if hasattr(contract, "BSMGreeks") and getattr(contract, "BSMInputs", None) == inputs:
+         # The Greeks are still valid: mark them as updated for the current time bar
+         greeks = contract.BSMGreeks
+         greeks.lastUpdated = self.context.Time
+         return greeks
+      return None
+
    # Compute and store the Greeks for a list of contracts
    def setGreeks(self, contracts, sigma = None, ir = None):
       # Start the timer
       self.context.executionTimer.start()
 
       if isinstance(contracts, list):
-         # Loop through all contracts
-         for contract in contracts:
-            # Get the current price of the underlying
-            spotPrice = self.contractUtils.getUnderlyingLastPrice(contract)
-            # Compute the Greeks for the contract
-            self.computeGreeks(contract, sigma = sigma, ir = ir, spotPrice = spotPrice, saveIt = True)
-      else:
+         # Compute the Greeks for the whole list in a single batch
+         self.setGreeksBatch(contracts, sigma = sigma, ir = ir)
+      elif getattr(contracts, "BSMGreeks", None) == None or contracts.BSMGreeks.lastUpdated != self.context.Time:
+         # The Greeks of this contract have not been computed yet for the current time bar (otherwise there is nothing to do, not even logging the details again)
          # Get the current price of the underlying
          spotPrice = self.contractUtils.getUnderlyingLastPrice(contracts)
          # Compute the Greeks on a single contract
@@ -469,7 +493,91 @@ class BSM:
       return
    
 
+   # Compute and store the Greeks for a list of contracts in a single batch (see bsmGreeksKernel). 
+   # The Implied Volatility is still computed for each contract, then the Greeks of all contracts are computed in one call
+   def setGreeksBatch(self, contracts, sigma = None, ir = None):
+      # Get the current time
+      currentTime = self.context.Time
+      # Avoid recomputing the Greeks of the contracts that have already been processed for this time bar
+      contracts = [contract for contract in contracts 
+                     if not (hasattr(contract, "BSMGreeks") and contract.BSMGreeks.lastUpdated == currentTime)
+                   ]
+      # Exit if there is nothing to compute
+      if not contracts:
+         return
+
+      # Use the risk free rate unless otherwise specified
+      self.setRiskFreeRate()
+      if ir == None:
+         ir = self.riskFreeRate
+
+      # Get the inputs of each contract, skipping the contracts whose inputs have not changed since the last time their Greeks were computed
+      pending = []
+      # The price of the underlying and the DTE are the same for all the contracts with the same underlying/expiry: only get them once
+      spotPriceBySymbol = {}
+      tauByExpiry = {}
+      # Bind the methods called for each contract (avoid resolving the attributes at each iteration)
+      greeksInputs = self.greeksInputs
+      getUnchangedGreeks = self.getUnchangedGreeks
+      for contract in contracts:
+         # Get the current price of the underlying
+         underlyingSymbol = contract.UnderlyingSymbol
+         spotPrice = spotPriceBySymbol.get(underlyingSymbol)
+         if spotPrice == None:
+            spotPrice = self.contractUtils.getUnderlyingLastPrice(contract)
+            spotPriceBySymbol[underlyingSymbol] = spotPrice
+         # Get the DTE as a fraction of a year
+         expiry = contract.Expiry
+         tau = tauByExpiry.get(expiry)
+         if tau == None:
+            tau = self.optionTau(contract)
+            tauByExpiry[expiry] = tau
+         inputs = greeksInputs(contract, spotPrice, tau, sigma, ir)
+         if getUnchangedGreeks(contract, inputs) == None:
+            pending.append((contract, inputs))
+      # Exit if all the Greeks are still valid
+      if not pending:
+         return
+      # Collect the inputs of each contract
+      nContracts = len(pending)
+      spotPrices = np.empty(nContracts, dtype = np.float64)
+      strikes = np.empty(nContracts, dtype = np.float64)
+      taus = np.empty(nContracts, dtype = np.float64)
+      sigmas = np.empty(nContracts, dtype = np.float64)
+      isCall = np.empty(nContracts, dtype = bool)
+      for n, (contract, inputs) in enumerate(pending):
+         spotPrices[n] = inputs[0]
+         taus[n] = inputs[2]
+         strikes[n] = contract.Strike
+         isCall[n] = contract.Right == OptionRight.Call
+         # Compute the Implied Volatility (unless otherwise specified)
+         sigmas[n] = self.bsmIV(contract, tau = taus[n], saveIt = True) if sigma == None else sigma
+
+      # Compute the Greeks of all contracts
+      delta, gamma, vega, theta, rho, vomma = bsmGreeksKernel(spotPrices, strikes, taus, sigmas, isCall, ir, self.tradingDays)
+
+      # Store the Greeks as an attribute of each contract object
+      for n, (contract, inputs) in enumerate(pending):
+         contract.BSMGreeks = BSMGreeks(delta = delta[n]
+                                        , gamma = gamma[n]
+                                        , vega = vega[n]
+                                        , theta = theta[n]
+                                        , rho = rho[n]
+                                        , vomma = vomma[n]
+                                        # Lambda (a.k.a. elasticity or leverage)
+                                        , elasticity = delta[n] * inputs[1]/spotPrices[n]
+                                        , IV = sigmas[n]
+                                        , IR = self.riskFreeRate
+                                        , lastUpdated = currentTime
+                                        )
+         contract.BSMInputs = inputs
+
+
 class BSMGreeks:
+
+   # A new object is created for each contract at each time bar: use slots (no per-instance dictionary)
+   __slots__ = ("Delta", "Gamma", "Vega", "Theta", "Rho", "Vomma", "Elasticity", "IV", "IR", "lastUpdated")
+
    def __init__(self, delta = None, gamma = None, vega = None, theta = None, rho = None, vomma = None, elasticity = None, IV = None, IR = None, lastUpdated = None, precision = 5):
       self.Delta = self.roundIt(delta, precision)
       self.Gamma = self.roundIt(gamma, precision)
@@ -482,6 +590,10 @@ class BSMGreeks:
       self.IR = self.roundIt(IR, precision)
       self.lastUpdated = lastUpdated
       
+   # Returns the Greeks as a new dictionary {<attribute>: <value>}
+   def asDict(self):
+      return {attribute: getattr(self, attribute) for attribute in BSMGreeks.__slots__}
+
    def roundIt(self, value, precision = None):
       if precision:
          return round(value, precision)
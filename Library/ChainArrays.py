@@ -0,0 +1,150 @@
+#region imports
+from AlgorithmImports import *
+#endregion
+
+########################################################################################
+#                                                                                      #
+# Licensed under the Apache License, Version 2.0 (the "License");                      #
+# you may not use this file except in compliance with the License.                     #
+# You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0   #
+#                                                                                      #
+# Unless required by applicable law or agreed to in writing, software                  #
+# distributed under the License is distributed on an "AS IS" BASIS,                    #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.             #
+# See the License for the specific language governing permissions and                  #
+# limitations under the License.                                                       #
+#                                                                                      #
+# Copyright [2021] [Rocco Claudio Cannizzaro]                                          #
+#                                                                                      #
+########################################################################################
+
+import numpy as np
+
+# Struct-of-arrays snapshot of a list of option contracts.
+# The attributes of each contract are read only once and stored into NumPy arrays (parallel to the input list), so they can be reused by multiple filters without accessing the contract objects again
+class ChainArrays:
+
+   # A new snapshot is created for each chain/time bar: use slots (no per-instance dictionary)
+   __slots__ = ("contracts", "time", "symbols", "symbolIndex", "strikes", "isCall", "putIdx", "callIdx", "putStrikes", "callStrikes", "bidPrices", "askPrices", "midPrices", "deltas", "kernelDeltas", "taus", "cache")
+
+   def __init__(self, contracts, time = None):
+      # Keep a reference to the list of contracts (used to check whether the snapshot refers to a given chain)
+      self.contracts = contracts
+      # The time at which the snapshot was taken
+      self.time = time
+      # List of contract symbols and the corresponding position inside the arrays
+      self.symbols = [contract.Symbol for contract in contracts]
+      self.symbolIndex = {symbol: idx for idx, symbol in enumerate(self.symbols)}
+      # Contract Strikes
+      self.strikes = np.array([contract.Strike for contract in contracts], dtype = np.float64)
+      # Contract type: True -> Call, False -> Put
+      self.isCall = np.array([contract.Right == OptionRight.Call for contract in contracts], dtype = bool)
+      # Indices of the Put/Call contracts sorted by ascending strike (stable sort: contracts with the same strike keep the chain order)
+      sortedIdx = np.argsort(self.strikes, kind = "stable")
+      sortedIsCall = self.isCall[sortedIdx]
+      self.putIdx = sortedIdx[~sortedIsCall]
+      self.callIdx = sortedIdx[sortedIsCall]
+      # Sorted Put/Call strikes (parallel to putIdx/callIdx), used to find a strike range with a binary search
+      self.putStrikes = self.strikes[self.putIdx]
+      self.callStrikes = self.strikes[self.callIdx]
+      # Bid/Ask/Mid prices of each contract (retrieved only if needed, see getMidPrices)
+      self.bidPrices = None
+      self.askPrices = None
+      self.midPrices = None
+      # BSM Delta of each contract (computed only if needed, see getDeltas). These are always the same values stored on the contracts (contract.BSMGreeks.Delta)
+      self.deltas = None
+      # Delta of each contract computed by the compiled Delta search (see StrategyBuilder.getDeltaIdxJit). The kernel uses its own IV solver and does not set the Greeks on the contracts, so its Deltas are kept separate from the BSM Deltas
+      self.kernelDeltas = None
+      # Time to expiration (as a fraction of a year) of each contract (computed only if needed, see getTaus)
+      self.taus = None
+      # Cache for any other result derived from this snapshot (i.e. the ATM contracts)
+      self.cache = {}
+
+   # Returns the cache shared by all the strategies for the chains processed at the current time (the cache is reset as soon as the time changes)
+   @staticmethod
+   def getSharedCache(context):
+      currentTime = context.Time
+      sharedCache = getattr(context, "chainCache", None)
+      if sharedCache == None or sharedCache["time"] != currentTime:
+         sharedCache = {"time": currentTime, "entries": {}}
+         context.chainCache = sharedCache
+      return sharedCache["entries"]
+
+   # Check if this snapshot refers to the given list of contracts at the given time
+   def isSnapshotOf(self, contracts, time = None):
+      return self.contracts is contracts and self.time == time
+
+   # Returns the indices (sorted by ascending strike) of the Put or Call contracts such that fromStrike <= Strike <= toStrike
+   def getStrikeRangeIdx(self, isCall, fromStrike, toStrike):
+      if isCall:
+         idx = self.callIdx
+         strikes = self.callStrikes
+      else:
+         idx = self.putIdx
+         strikes = self.putStrikes
+      # Find the boundaries of the range with a binary search on the sorted strikes
+      leftIdx = np.searchsorted(strikes, fromStrike, side = "left")
+      rightIdx = np.searchsorted(strikes, toStrike, side = "right")
+      return idx[leftIdx:rightIdx]
+
+   # Returns the array of mid-prices (parallel to the contracts), making sure the prices of the contracts at the given indices (default: all contracts) are available.
+   # Each price is only retrieved the first time it is needed and reused for the rest of the snapshot (the prices that have not been retrieved yet are NaN)
+   def getMidPrices(self, contractUtils, indices = None):
+      contracts = self.contracts
+      if self.midPrices is None:
+         self.bidPrices = np.full(len(contracts), np.nan, dtype = np.float64)
+         self.askPrices = np.full(len(contracts), np.nan, dtype = np.float64)
+         self.midPrices = np.full(len(contracts), np.nan, dtype = np.float64)
+      midPrices = self.midPrices
+      if indices is None:
+         indices = np.arange(len(contracts))
+      # Get the prices that are still missing
+      missingIdx = indices[np.isnan(midPrices[indices])]
+      if len(missingIdx) > 0:
+         # Read the Bid/Ask prices of the securities (same source used by ContractUtils.midPrice), then compute the mid-prices in a single vectorized operation
+         getSecurity = contractUtils.getSecurity
+         securities = [getSecurity(contracts[idx]) for idx in missingIdx]
+         self.bidPrices[missingIdx] = [security.BidPrice for security in securities]
+         self.askPrices[missingIdx] = [security.AskPrice for security in securities]
+         midPrices[missingIdx] = 0.5 * (self.bidPrices[missingIdx] + self.askPrices[missingIdx])
+      return midPrices
+
+   # Returns the array of BSM Deltas (parallel to the contracts), making sure the Deltas of the contracts at the given indices are available.
+   # The Greeks are only computed the first time they are needed (in a single batch) and reused for the rest of the snapshot (the Deltas that have not been computed yet are NaN)
+   def getDeltas(self, bsm, indices):
+      contracts = self.contracts
+      if self.deltas is None:
+         self.deltas = np.full(len(contracts), np.nan, dtype = np.float64)
+      deltas = self.deltas
+      # Get the Deltas that are still missing
+      missingIdx = indices[np.isnan(deltas[indices])]
+      if len(missingIdx) > 0:
+         missingContracts = [contracts[idx] for idx in missingIdx]
+         # Compute the Greeks (they are also stored on each contract)
+         bsm.setGreeks(missingContracts)
+         deltas[missingIdx] = [contract.BSMGreeks.Delta for contract in missingContracts]
+      return deltas
+
+   # Returns the array of times to expiration (parallel to the contracts), making sure the values for the contracts at the given indices are available (the values that have not been computed yet are NaN).
+   # The time to expiration only depends on the expiry date, so it is computed once for each expiry
+   def getTaus(self, bsm, indices):
+      contracts = self.contracts
+      if self.taus is None:
+         self.taus = np.full(len(contracts), np.nan, dtype = np.float64)
+      taus = self.taus
+      # Get the values that are still missing
+      missingIdx = indices[np.isnan(taus[indices])]
+      if len(missingIdx) > 0:
+         tauByExpiry = {}
+         for idx in missingIdx:
+            contract = contracts[idx]
+            expiry = contract.Expiry
+            if expiry not in tauByExpiry:
+               tauByExpiry[expiry] = bsm.optionTau(contract)
+            taus[idx] = tauByExpiry[expiry]
+      return taus
+
+   # Returns the contracts at the given indices
+   def getContracts(self, indices):
+      contracts = self.contracts
+      return [contracts[idx] for idx in indices]
@@ -46,19 +46,31 @@ class ContractUtils:
    def getSecurity(self, contract):
       # Get the Securities object
       Securities = self.context.Securities
+      # Get the Symbol attribute (if available)
+      symbol = getattr(contract, "Symbol", None)
       # Check if we can extract the Symbol attribute
-      if hasattr(contract, "Symbol") and contract.Symbol in Securities:
+      if symbol != None and symbol in Securities:
          # Get the security from the Securities dictionary if available (pull the latest price), else use the contract object itself
-         security = Securities[contract.Symbol]
+         security = Securities[symbol]
       else:
          # Use the contract itself
          security = contract
       return security
    
-   # Returns the mid-price of an option contract
+   # Returns the mid-price of an option contract. 
+   # The price is stored on the contract together with the current time, so any further call within the same time bar (i.e. at each iteration of the IV solver) does not access the security again
    def midPrice(self, contract):
+      # Get the current time
+      currentTime = self.context.Time
+      # Check if the mid-price has already been computed for the current time bar
+      midPriceCache = getattr(contract, "MidPriceCache", None)
+      if midPriceCache != None and midPriceCache[0] == currentTime:
+         return midPriceCache[1]
       security = self.getSecurity(contract)
-      return 0.5*(security.BidPrice + security.AskPrice)
+      midPrice = 0.5*(security.BidPrice + security.AskPrice)
+      # Store the mid-price for the current time bar
+      contract.MidPriceCache = (currentTime, midPrice)
+      return midPrice
 
    def bidAskSpread(self, contract):
       security = self.getSecurity(contract)
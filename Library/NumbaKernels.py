@@ -0,0 +1,417 @@
+#region imports
+from AlgorithmImports import *
+#endregion
+
+########################################################################################
+#                                                                                      #
+# Licensed under the Apache License, Version 2.0 (the "License");                      #
+# you may not use this file except in compliance with the License.                     #
+# You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0   #
+#                                                                                      #
+# Unless required by applicable law or agreed to in writing, software                  #
+# distributed under the License is distributed on an "AS IS" BASIS,                    #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.             #
+# See the License for the specific language governing permissions and                  #
+# limitations under the License.                                                       #
+#                                                                                      #
+# Copyright [2021] [Rocco Claudio Cannizzaro]                                          #
+#                                                                                      #
+########################################################################################
+
+# Numerical kernels compiled with Numba.
+# These functions only operate on NumPy arrays and scalars (no QuantConnect objects), so the caller is responsible for extracting the relevant contract attributes
+#
+# All kernels are compiled with fastmath and without bounds checking. Transcendental functions (np.exp, np.log, np.sqrt) are vectorized 
+# through Intel SVML when the icc_rt package is installed in the environment (conda install -c numba icc_rt). 
+# Use svmlEnabled to check whether SVML is available: if not, the kernels still work but fall back to the standard libm implementation.
+
+import math
+import numpy as np
+
+# Make sure Numba is available
+try:
+   import numba
+   from numba import njit
+except ImportError as e:
+   raise ImportError("The numba package is required by NumbaKernels. Install it with: pip install numba") from e
+
+# Flag indicating whether Numba is using Intel SVML for the vectorized math functions
+svmlEnabled = bool(getattr(numba.config, "USING_SVML", False))
+
+# Compilation options shared by all kernels
+jitOptions = {"cache": True
+              , "fastmath": True
+              , "error_model": "numpy"
+              , "boundscheck": False
+              }
+
+# Compilation options for the kernels that rely on IEEE infinities (i.e. d1 = +/-Inf for expired contracts): fastmath assumes there are no Inf/NaN values, so it must be disabled
+exactJitOptions = dict(jitOptions, fastmath = False)
+
+# Signatures of the kernels. The kernels are compiled eagerly (ahead of the first call) when this module is imported, 
+# or loaded from the on-disk cache (cache = True) so there is no JIT compilation during the backtest
+payoffSignature = "float64(float64, float64[:], float64[:], float64[:])"
+maxLossSignature = "float64(float64, float64[:], float64[:], float64[:])"
+orderPricesSignature = "Tuple((float64[::1], float64, float64, float64))(float64[:], float64[:], float64[:])"
+normCdfSignature = "float64(float64)"
+bsmGreeksSignature = "UniTuple(float64[::1], 6)(float64[:], float64[:], float64[:], float64[:], boolean[:], float64, float64)"
+
+# Constants used by the BSM kernels
+invSqrt2 = 1.0/math.sqrt(2.0)
+invSqrt2Pi = 1.0/math.sqrt(2.0*math.pi)
+
+# Compute the payoff at expiration of a set of option contracts
+#  - strikes: the strike of each contract
+#  - directions: +1 -> Call, -1 -> Put
+#  - sides: the side of each contract (-n -> Short, +n -> Long)
+@njit(payoffSignature, **jitOptions)
+def payoffKernel(spotPrice, strikes, directions, sides):
+   # initialize the payoff
+   payoff = 0.0
+   for n in range(strikes.shape[0]):
+      # Add the payoff of the current contract
+      payoff += sides[n] * max(0.0, directions[n] * (spotPrice - strikes[n]))
+   # Return the payoff
+   return payoff
+
+# Compute the maximum loss at expiration of a set of option contracts (see payoffKernel for the description of the input arrays)
+@njit(maxLossSignature, **jitOptions)
+def maxLossKernel(underlyingPrice, strikes, directions, sides):
+   # Evaluate the payoff at the extreme (spotPrice = 0)
+   maxLoss = payoffKernel(0.0, strikes, directions, sides)
+   # Evaluate the payoff at each strike
+   for n in range(strikes.shape[0]):
+      maxLoss = min(maxLoss, payoffKernel(strikes[n], strikes, directions, sides))
+   # Evaluate the payoff at the extreme (spotPrice = 10x higher)
+   maxLoss = min(maxLoss, payoffKernel(underlyingPrice * 10.0, strikes, directions, sides))
+   # Cap the payoff at zero: we are only interested in losses
+   return min(0.0, maxLoss)
+
+# Aggregate the prices of the legs of an order:
+#  - sides: the side of each contract (-n -> Short, +n -> Long)
+#  - bidPrices/askPrices: the Bid/Ask price of each contract
+# Returns a tuple (legMidPrices, orderMidPrice, bidAskSpread, totalQuantity):
+#  - legMidPrices: the mid-price of each contract
+#  - orderMidPrice: the mid-price of the order (positive -> credit, negative -> debit)
+#  - bidAskSpread: the sum of the Bid-Ask spreads of all contracts
+#  - totalQuantity: the total number of contracts (sum of the absolute sides), used to compute the slippage
+@njit(orderPricesSignature, **jitOptions)
+def orderPricesKernel(sides, bidPrices, askPrices):
+   nLegs = sides.shape[0]
+   legMidPrices = np.empty(nLegs, dtype = np.float64)
+   orderMidPrice = 0.0
+   bidAskSpread = 0.0
+   totalQuantity = 0.0
+   for n in range(nLegs):
+      legMidPrices[n] = 0.5 * (bidPrices[n] + askPrices[n])
+      # Keep track of the total credit/debit of the order
+      orderMidPrice -= sides[n] * legMidPrices[n]
+      bidAskSpread += abs(askPrices[n] - bidPrices[n])
+      totalQuantity += abs(sides[n])
+   return legMidPrices, orderMidPrice, bidAskSpread, totalQuantity
+
+# Cumulative distribution function of the standard normal distribution (same as scipy.stats.norm.cdf)
+@njit(normCdfSignature, **exactJitOptions)
+def normCdfKernel(x):
+   return 0.5 * math.erfc(-x * invSqrt2)
+
+# Compute the BSM Greeks (no dividends) of a batch of option contracts. Same formulas as the BSM class (see BSMLibrary.py), including the edge cases (tau = 0 or sigma = 0)
+#  - spotPrices: the price of the underlying of each contract
+#  - strikes: the strike of each contract
+#  - taus: the time to expiration of each contract (as a fraction of a year)
+#  - sigmas: the implied volatility of each contract
+#  - isCall: True -> Call, False -> Put
+#  - ir: the risk free rate
+#  - tradingDays: the number of days in a year (used to compute the daily Theta)
+# Returns a tuple of arrays (delta, gamma, vega, theta, rho, vomma)
+@njit(bsmGreeksSignature, **exactJitOptions)
+def bsmGreeksKernel(spotPrices, strikes, taus, sigmas, isCall, ir, tradingDays):
+   nContracts = strikes.shape[0]
+   delta = np.empty(nContracts, dtype = np.float64)
+   gamma = np.empty(nContracts, dtype = np.float64)
+   vega = np.empty(nContracts, dtype = np.float64)
+   theta = np.empty(nContracts, dtype = np.float64)
+   rho = np.empty(nContracts, dtype = np.float64)
+   vomma = np.empty(nContracts, dtype = np.float64)
+   for n in range(nContracts):
+      spotPrice = spotPrices[n]
+      strike = strikes[n]
+      tau = taus[n]
+      sigma = sigmas[n]
+      sqrtTau = math.sqrt(tau)
+      # Compute D1
+      if tau == 0.0 or sigma == 0.0:
+         # Expired contract or IV could not be computed: d1 = +/-Inf based on whether the contract is ITM and on its type
+         if isCall[n]:
+            d1 = math.inf if strike < spotPrice else -math.inf
+         else:
+            d1 = -math.inf if spotPrice < strike else math.inf
+      else:
+         d1 = (math.log(spotPrice/strike) + (ir + 0.5*sigma**2)*tau)/(sigma * sqrtTau)
+      # Compute D2
+      d2 = d1 - sigma * sqrtTau
+      # N'(d1)
+      pdfD1 = math.exp(-0.5 * d1 * d1) * invSqrt2Pi
+      # X*e^(-r*tau)
+      Xert = strike * math.exp(-ir*tau)
+      # -S*N'(d1)*sigma/(2*sqrt(tau))
+      SNs = -(spotPrice * pdfD1 * sigma) / (2.0 * sqrtTau)
+      if isCall[n]:
+         delta[n] = normCdfKernel(d1)
+         theta[n] = (SNs - ir * Xert * normCdfKernel(d2))/tradingDays
+         rho[n] = tau * ir * Xert * normCdfKernel(d2)
+      else:
+         delta[n] = -normCdfKernel(-d1)
+         theta[n] = (SNs + ir * Xert * normCdfKernel(-d2))/tradingDays
+         rho[n] = -tau * ir * Xert * normCdfKernel(-d2)
+      # Second order derivatives
+      if sigma == 0.0 or tau == 0.0:
+         gamma[n] = math.inf
+      else:
+         gamma[n] = pdfD1 / (spotPrice * sigma * sqrtTau)
+      vega[n] = spotPrice * pdfD1 * sqrtTau
+      if sigma == 0.0:
+         vomma[n] = math.inf
+      else:
+         vomma[n] = spotPrice * pdfD1 * sqrtTau * d1 * d2 / sigma
+   return delta, gamma, vega, theta, rho, vomma
+
+# Signatures of the kernels used to find the contract with the closest Delta (see deltaIdxKernel)
+bsmIVSignature = "float64(float64, float64, float64, float64, boolean, float64, float64)"
+deltaAtSignature = "boolean(int64, float64, float64[:], float64[:], float64[:], boolean, float64, float64[:], float64[:])"
+deltaIdxSignature = "int64(float64, float64[:], float64[:], float64[:], boolean, float64, float64, float64[:], float64[:], int64)"
+
+# BSM price, Vega and Vomma of a single contract (same formulas as BSM.bsmPrice, BSM.bsmVega and BSM.bsmVomma), used by the Implied Volatility solver
+@njit("UniTuple(float64, 3)(float64, float64, float64, float64, boolean, float64)", **exactJitOptions)
+def bsmPriceVegaVommaKernel(spotPrice, strike, tau, sigma, isCall, ir):
+   sqrtTau = math.sqrt(tau)
+   # Compute D1
+   if tau == 0.0 or sigma == 0.0:
+      # Expired contract or IV could not be computed: d1 = +/-Inf based on whether the contract is ITM and on its type
+      if isCall:
+         d1 = math.inf if strike < spotPrice else -math.inf
+      else:
+         d1 = -math.inf if spotPrice < strike else math.inf
+   else:
+      d1 = (math.log(spotPrice/strike) + (ir + 0.5*sigma**2)*tau)/(sigma * sqrtTau)
+   # Compute D2
+   d2 = d1 - sigma * sqrtTau
+   # X*e^(-r*tau)
+   Xert = strike * math.exp(-ir*tau)
+   if isCall:
+      price = normCdfKernel(d1)*spotPrice - normCdfKernel(d2)*Xert
+   else:
+      price = normCdfKernel(-d2)*Xert - normCdfKernel(-d1)*spotPrice
+   # S*N'(d1)*sqrt(tau)
+   vega = spotPrice * math.exp(-0.5 * d1 * d1) * invSqrt2Pi * sqrtTau
+   if sigma == 0.0:
+      vomma = math.inf
+   else:
+      vomma = vega * d1 * d2 / sigma
+   return price, vega, vomma
+
+# Compute the Implied Volatility of a single contract from its mid-price (same method as BSM.bsmIV): 
+#  - Halley's method starting at x0 (max 50 iterations)
+#  - Bisection over the interval [0.0001, 2] if Halley's method did not converge
+# Returns NaN if the root could not be found
+@njit(bsmIVSignature, **exactJitOptions)
+def bsmIVKernel(midPrice, spotPrice, strike, tau, isCall, ir, x0):
+   xtol = 1e-6
+   # Halley's method
+   sigma = x0
+   for _ in range(50):
+      price, vega, vomma = bsmPriceVegaVommaKernel(spotPrice, strike, tau, sigma, isCall, ir)
+      f = price - midPrice
+      if f == 0.0:
+         return sigma
+      if vega == 0.0:
+         break
+      newtonStep = f/vega
+      adj = newtonStep * vomma / vega / 2.0
+      if abs(adj) < 1.0:
+         newtonStep /= 1.0 - adj
+      newSigma = sigma - newtonStep
+      if abs(newSigma - sigma) <= xtol:
+         return newSigma
+      sigma = newSigma
+
+   # Fallback: Bisection (the root must be bracketed by the interval)
+   left = 0.0001
+   right = 2.0
+   fLeft = bsmPriceVegaVommaKernel(spotPrice, strike, tau, left, isCall, ir)[0] - midPrice
+   fRight = bsmPriceVegaVommaKernel(spotPrice, strike, tau, right, isCall, ir)[0] - midPrice
+   if fLeft == 0.0:
+      return left
+   if fRight == 0.0:
+      return right
+   if not (fLeft * fRight < 0.0):
+      return math.nan
+   while (right - left) > xtol:
+      middle = 0.5 * (left + right)
+      fMiddle = bsmPriceVegaVommaKernel(spotPrice, strike, tau, middle, isCall, ir)[0] - midPrice
+      if fMiddle == 0.0:
+         return middle
+      if (fMiddle < 0.0) == (fLeft < 0.0):
+         left = middle
+         fLeft = fMiddle
+      else:
+         right = middle
+   return 0.5 * (left + right)
+
+# Make sure the Delta of the n-th contract is available (see deltaIdxKernel for the description of the input arrays): 
+# the IV and the Delta are only computed if the Delta is NaN, and stored into the ivs/deltas arrays. Returns False if the IV could not be computed
+@njit(deltaAtSignature, **exactJitOptions)
+def deltaAtKernel(n, spotPrice, strikes, midPrices, taus, isCall, ir, ivs, deltas):
+   if not math.isnan(deltas[n]):
+      return True
+   sigma = bsmIVKernel(midPrices[n], spotPrice, strikes[n], taus[n], isCall, ir, ivs[n])
+   if math.isnan(sigma):
+      return False
+   ivs[n] = sigma
+   strike = strikes[n]
+   tau = taus[n]
+   # Compute D1
+   if tau == 0.0 or sigma == 0.0:
+      if isCall:
+         d1 = math.inf if strike < spotPrice else -math.inf
+      else:
+         d1 = -math.inf if spotPrice < strike else math.inf
+   else:
+      d1 = (math.log(spotPrice/strike) + (ir + 0.5*sigma**2)*tau)/(sigma * math.sqrt(tau))
+   if isCall:
+      deltas[n] = normCdfKernel(d1)
+   else:
+      deltas[n] = -normCdfKernel(-d1)
+   return True
+
+# Find the contract with the Delta closest to the target Delta (same search as StrategyBuilder.getDeltaIdx), computing the IV and the Delta of the contracts visited by the search:
+#  - spotPrice: the price of the underlying
+#  - strikes/midPrices/taus: the strike, mid-price and time to expiration (as a fraction of a year) of each contract (all of the same type, sorted by ascending strike)
+#  - isCall: True -> Calls, False -> Puts
+#  - ir: the risk free rate
+#  - targetDelta: the requested Delta (absolute value, as a fraction: i.e. 0.25)
+#  - ivs: [in/out] the initial guess of the IV of each contract (replaced by the IV for the contracts visited by the search)
+#  - deltas: [in/out] the Delta of each contract (NaN -> not computed yet)
+#  - seedIdx: the position of the contract found by the previous search (-1 -> not available), used as the starting point of the search
+# Returns the position of the contract with the closest Delta, or -1 if the IV of any of the contracts visited by the search could not be computed
+@njit(deltaIdxSignature, **exactJitOptions)
+def deltaIdxKernel(spotPrice, strikes, midPrices, taus, isCall, ir, targetDelta, ivs, deltas, seedIdx):
+   leftIdx = 0
+   rightIdx = strikes.shape[0]-1
+
+   # Compute the Delta of the contracts at the extremes
+   if not (deltaAtKernel(leftIdx, spotPrice, strikes, midPrices, taus, isCall, ir, ivs, deltas) 
+           and deltaAtKernel(rightIdx, spotPrice, strikes, midPrices, taus, isCall, ir, ivs, deltas)):
+      return -1
+
+   # Check if the requested Delta is outside of the range (furthest OTM/ITM contracts: the highest/lowest strike for Calls, the lowest/highest strike for Puts)
+   otmIdx = rightIdx if isCall else leftIdx
+   itmIdx = leftIdx if isCall else rightIdx
+   if abs(deltas[otmIdx]) > targetDelta:
+      return otmIdx
+   elif abs(deltas[itmIdx]) < targetDelta:
+      return itmIdx
+
+   # Hunt phase: expand the search interval around the seed (1, 2, 4, ... contracts) until it brackets the requested Delta
+   if seedIdx >= 0 and (rightIdx-leftIdx) > 1:
+      seedIdx = min(max(seedIdx, leftIdx + 1), rightIdx - 1)
+      if not deltaAtKernel(seedIdx, spotPrice, strikes, midPrices, taus, isCall, ir, ivs, deltas):
+         return -1
+      step = 1
+      if (abs(deltas[seedIdx]) > targetDelta) == isCall:
+         leftIdx = seedIdx
+         while seedIdx + step < rightIdx:
+            probeIdx = seedIdx + step
+            if not deltaAtKernel(probeIdx, spotPrice, strikes, midPrices, taus, isCall, ir, ivs, deltas):
+               return -1
+            if (abs(deltas[probeIdx]) > targetDelta) != isCall:
+               rightIdx = probeIdx
+               break
+            leftIdx = probeIdx
+            step *= 2
+      else:
+         rightIdx = seedIdx
+         while seedIdx - step > leftIdx:
+            probeIdx = seedIdx - step
+            if not deltaAtKernel(probeIdx, spotPrice, strikes, midPrices, taus, isCall, ir, ivs, deltas):
+               return -1
+            if (abs(deltas[probeIdx]) > targetDelta) == isCall:
+               leftIdx = probeIdx
+               break
+            rightIdx = probeIdx
+            step *= 2
+
+   # Bisection
+   while (rightIdx-leftIdx) > 1:
+      middleIdx = int(round((leftIdx + rightIdx)/2.0))
+      if not deltaAtKernel(middleIdx, spotPrice, strikes, midPrices, taus, isCall, ir, ivs, deltas):
+         return -1
+      # Calls: the Delta decreases with the strike, Puts: the Delta increases with the strike
+      if (abs(deltas[middleIdx]) > targetDelta) == isCall:
+         leftIdx = middleIdx
+      else:
+         rightIdx = middleIdx
+
+   # Choose the contract with the closest Delta (the left one in case of a tie)
+   if abs(abs(deltas[rightIdx]) - targetDelta) < abs(abs(deltas[leftIdx]) - targetDelta):
+      return rightIdx
+   return leftIdx
+
+# Merge the indices of the Put and Call contracts (each sorted by ascending strike) into a single list sorted by strike, in ascending or descending (reverse = True) order.
+# Same order as a stable sort of the concatenation [putIdx, callIdx]: contracts with the same strike keep their relative order, with the Puts ahead of the Calls
+#  - putIdx/callIdx: the indices of the Put/Call contracts
+#  - strikes: the strike of each contract (indexed by putIdx/callIdx)
+#  - limit: maximum number of indices returned (-1 -> no limit)
+mergeIdxSignature = "int64[::1](int64[:], int64[:], float64[:], boolean, int64)"
+@njit(mergeIdxSignature, **jitOptions)
+def mergeIdxKernel(putIdx, callIdx, strikes, reverse, limit):
+   nPuts = putIdx.shape[0]
+   nCalls = callIdx.shape[0]
+   nResult = nPuts + nCalls
+   if limit >= 0:
+      nResult = min(nResult, limit)
+   result = np.empty(nResult, dtype = np.int64)
+   n = 0
+   if not reverse:
+      # Ascending order: take the lowest strike at each step (the Put in case of a tie)
+      i = 0
+      j = 0
+      while n < nResult:
+         if j >= nCalls or (i < nPuts and strikes[putIdx[i]] <= strikes[callIdx[j]]):
+            result[n] = putIdx[i]
+            i += 1
+         else:
+            result[n] = callIdx[j]
+            j += 1
+         n += 1
+   else:
+      # Descending order: take the group of contracts with the highest strike at each step, keeping their original order (Puts first)
+      i = nPuts
+      j = nCalls
+      while n < nResult:
+         # Get the highest strike still available
+         if i == 0:
+            strike = strikes[callIdx[j-1]]
+         elif j == 0:
+            strike = strikes[putIdx[i-1]]
+         else:
+            strike = max(strikes[putIdx[i-1]], strikes[callIdx[j-1]])
+         # Find the Puts and Calls with this strike
+         iStart = i
+         while iStart > 0 and strikes[putIdx[iStart-1]] == strike:
+            iStart -= 1
+         jStart = j
+         while jStart > 0 and strikes[callIdx[jStart-1]] == strike:
+            jStart -= 1
+         # Add the Puts, then the Calls
+         for k in range(iStart, i):
+            if n < nResult:
+               result[n] = putIdx[k]
+               n += 1
+         for k in range(jStart, j):
+            if n < nResult:
+               result[n] = callIdx[k]
+               n += 1
+         i = iStart
+         j = jStart
+   return result
@@ -102,11 +102,9 @@ class OptionStrategyCore(OptionStrategyOrder):
 
       # Check if we need to do dynamic DTE selection
       if dynamicDTESelection and lastClosedDte != None:
-         # Get the expiration with the nearest DTE as that of the last closed position
-         expiry = sorted(expiryList
-                         , key = lambda expiry: abs((expiry.date() - context.Time.date()).days - lastClosedDte)
-                         , reverse = False
-                         )[0]
+         # Get the expiration with the nearest DTE as that of the last closed position (the first one in the list in case of a tie)
+         today = context.Time.date()
+         expiry = min(expiryList, key = lambda expiry: abs((expiry.date() - today).days - lastClosedDte))
       else:
          # Determine the index used to select the expiry date:
          # useFurthestExpiry = True -> expiryListIndex = 0 (takes the first entry -> furthest expiry date since the expiry list is sorted in reverse order)
@@ -117,10 +115,11 @@ class OptionStrategyCore(OptionStrategyOrder):
          
          
       # Convert the date to a string
-      expiryStr = expiry.strftime("%Y-%m-%d")
+      expiryStr = self.getExpiryStr(expiry)
       
       # Proceed if we have not already opened a position on the given expiration (unless we are allowed to open multiple positions on the same expiry date)
-      if(parameters["allowMultipleEntriesPerExpiry"] or expiryStr not in self.openPositions):
+      # When allowMultipleEntriesPerExpiry = False, the open positions are keyed by the expiry date (see openPosition), so this is a single dictionary lookup
+      if(allowMultipleEntriesPerExpiry or expiryStr not in self.openPositions):
          # Filter the contracts in the chain, keep only the ones expiring on the given date
          filteredChain = self.filterByExpiry(chain, expiry = expiry)
          # Call the getOrder method of the class implementing OptionStrategy 
@@ -137,8 +136,17 @@ class OptionStrategyCore(OptionStrategyOrder):
       
       # Check if the expiry date has been specified
       if expiry != None:
-         # Filter contracts based on the requested expiry date
-         filteredChain = [contract for contract in chain if contract.Expiry == expiry]
+         # Check if this chain has already been filtered by another strategy at the current time: 
+         # sharing the same list allows all strategies to reuse the same struct-of-arrays snapshot of the filtered chain
+         sharedCache = ChainArrays.getSharedCache(self.context)
+         cacheKey = ("filterByExpiry", id(chain), expiry)
+         cachedEntry = sharedCache.get(cacheKey)
+         if cachedEntry != None and cachedEntry[0] is chain:
+            filteredChain = cachedEntry[1]
+         else:
+            # Filter contracts based on the requested expiry date
+            filteredChain = [contract for contract in chain if contract.Expiry == expiry]
+            sharedCache[cacheKey] = (chain, filteredChain)
       else:
          # No filtering
          filteredChain = chain
@@ -146,7 +154,7 @@ class OptionStrategyCore(OptionStrategyOrder):
       # Check if we need to compute the Greeks for every single contract (this is expensive!)
       # By defauls, the Greeks are only calculated while searching for the strike with the requested delta, so there should be no need to set computeGreeks = True
       if computeGreeks:
-         self.bsm.setGreeks(filteredChain)
+         self.strategyBuilder.setChainGreeks(filteredChain)
 
       # Stop the timer
       self.context.executionTimer.stop()
@@ -154,11 +162,49 @@ class OptionStrategyCore(OptionStrategyOrder):
       # Return the filtered contracts
       return filteredChain
 
+   # Filter the chain for multiple expiry dates with a single pass over the contracts. Returns a dictionary {<expiry>: <filtered chain>}
+   def filterByExpiries(self, chain, expiries, computeGreeks = False):
+      # Start the timer
+      self.context.executionTimer.start()
+
+      # Reuse the filtered chains that have already been computed (by this or another strategy) at the current time
+      sharedCache = ChainArrays.getSharedCache(self.context)
+      chainId = id(chain)
+      filteredChains = {}
+      for expiry in set(expiries):
+         cachedEntry = sharedCache.get(("filterByExpiry", chainId, expiry))
+         if cachedEntry != None and cachedEntry[0] is chain:
+            filteredChains[expiry] = cachedEntry[1]
+
+      # Get the expiry dates that still need to be filtered
+      buckets = {expiry: [] for expiry in expiries if expiry not in filteredChains}
+      if buckets:
+         # Scan the chain only once, assigning each contract to the bucket of its expiry date
+         for contract in chain:
+            bucket = buckets.get(contract.Expiry)
+            if bucket != None:
+               bucket.append(contract)
+         # Share the filtered chains (same entries used by filterByExpiry)
+         for expiry, filteredChain in buckets.items():
+            sharedCache[("filterByExpiry", chainId, expiry)] = (chain, filteredChain)
+         filteredChains.update(buckets)
+
+      # Check if we need to compute the Greeks for every single contract (this is expensive!)
+      if computeGreeks:
+         for filteredChain in filteredChains.values():
+            self.strategyBuilder.setChainGreeks(filteredChain)
+
+      # Stop the timer
+      self.context.executionTimer.stop()
+
+      # Return the filtered contracts
+      return filteredChains
+
    # Open a position based on the order details (as returned by getOrderDetails)
    def openPosition(self, order, linkedOrderTag = None):
 
       # Exit if there is no order to process
-      if order == None:
+      if not order:
          return
 
       # Start the timer
@@ -175,7 +221,7 @@ class OptionStrategyCore(OptionStrategyOrder):
       # Get the list of contracts
       contracts = order["contracts"]
       # Exit if there are no contracts
-      if(len(contracts) == 0):
+      if not contracts:
          return
 
       useLimitOrders = parameters["useLimitOrders"]
@@ -202,11 +248,10 @@ class OptionStrategyCore(OptionStrategyOrder):
       bidAskSpread = order["open"]["bidAskSpread"]
       orderMidPrice = order["open"]["orderMidPrice"]
       limitOrderPrice = order["open"]["limitOrderPrice"]
-      limitOrderAdjustment = order["open"]["limitOrderAdjustment"]
       slippage = order["open"]["slippage"]
 
       # Expiry String
-      expiryStr = expiry.strftime("%Y-%m-%d")
+      expiryStr = self.getExpiryStr(expiry)
 
       # Validate the order prior to submit
       if (  # We have a minimum order quantity
@@ -233,6 +278,7 @@ class OptionStrategyCore(OptionStrategyOrder):
       # Mark the time when this order has been submitted. This is needed to determine when to cancel Limit orders
       order["submittedDttm"] = currentDttm
       
+      # Set the key of the position: the run method relies on the positions being keyed by their expiry date to check whether a position is already open on that date
       if parameters["allowMultipleEntriesPerExpiry"]:
          positionKey = orderId
       else:
@@ -299,7 +345,7 @@ class OptionStrategyCore(OptionStrategyOrder):
 
       # Add details about the mid price, fill price and related stats 
       for key, side in zip(sidesDesc, sides):
-         position[f"{self.name}.{key}.Expiry"] = order["contractExpiry"][key].strftime("%Y-%m-%d")
+         position[f"{self.name}.{key}.Expiry"] = self.getExpiryStr(order["contractExpiry"][key])
          position[f"{self.name}.{key}.side"] = side
          position[f"{self.name}.{key}.openMidPrice"] = float("NaN")
          position[f"{self.name}.{key}.closeMidPrice"] = float("NaN")
@@ -322,14 +368,16 @@ class OptionStrategyCore(OptionStrategyOrder):
       # Add details about the greeks, and create placeholders to keep track of their range (Min, Avg, Max)
       #for greek in ["delta", "gamma", "vega", "theta", "rho", "vomma", "elasticity"]:
       for greek in parameters["greeksIncluded"]:
-         for key in sidesDesc:
-            position[f"{self.name}.{key}.{greek.title()}"] = order[f"{greek.lower()}"][key]
+         # Get the values of this greek for all the legs (column of the greeks array)
+         greekValues = order["greeks"][:, OptionStrategyOrderCore.greekIndex[greek.lower()]].tolist()
+         for key, greekValue in zip(sidesDesc, greekValues):
+            position[f"{self.name}.{key}.{greek.title()}"] = greekValue
             if parameters["includeLegDetails"]:
-               position[f"{self.name}.{key}.{greek.title()}.Close"] = order[f"{greek.lower()}"][key]
-               position[f"{self.name}.{key}.{greek.title()}.Min"] = order[f"{greek.lower()}"][key]
-               position[f"{self.name}.{key}.{greek.title()}.Avg"] = order[f"{greek.lower()}"][key]
-               position[f"{self.name}.{key}.{greek.title()}.Max"] = order[f"{greek.lower()}"][key]
-               position[f"{self.name}.{key}.{greek.title()}.EMA({emaMemory})"] = order[f"{greek.lower()}"][key]
+               position[f"{self.name}.{key}.{greek.title()}.Close"] = greekValue
+               position[f"{self.name}.{key}.{greek.title()}.Min"] = greekValue
+               position[f"{self.name}.{key}.{greek.title()}.Avg"] = greekValue
+               position[f"{self.name}.{key}.{greek.title()}.Max"] = greekValue
+               position[f"{self.name}.{key}.{greek.title()}.EMA({emaMemory})"] = greekValue
       
        # Add details about the IV 
       for key in sidesDesc:
@@ -364,7 +412,7 @@ class OptionStrategyCore(OptionStrategyOrder):
          # Subscribe to the option contract data feed
          if not contract.Symbol in context.optionContractsSubscriptions:
             context.AddOptionContract(contract.Symbol, context.timeResolution)
-            context.optionContractsSubscriptions.append(contract.Symbol)
+            context.optionContractsSubscriptions.add(contract.Symbol)
 
          # Get the contract side (Long/Short)
          orderSide = contractSide[contract.Symbol]
@@ -427,16 +475,21 @@ class OptionStrategyCore(OptionStrategyOrder):
          orderSign = 2*int(orderType == "open")-1
          # Sign of the transaction: open -> -1,  close -> +1
          transactionSign = -orderSign
+         # Get the security of each contract (a single lookup for each leg)
+         securities = [self.contractUtils.getSecurity(contract) for contract in contracts]
+         # Collect the Bid/Ask prices of all legs into arrays
+         bidPrices = np.array([security.BidPrice for security in securities], dtype = np.float64)
+         askPrices = np.array([security.AskPrice for security in securities], dtype = np.float64)
          # Get the mid price of each contract
-         prices = np.array(list(map(self.contractUtils.midPrice, contracts)))
+         prices = 0.5*(bidPrices + askPrices)
          # Get the order sides
          orderSides = np.array(limitOrder["orderSides"])
          # Total slippage
-         totalSlippage = sum(abs(orderSides)) * slippage
+         totalSlippage = float(np.sum(np.abs(orderSides))) * slippage
          # Compute the total order price (including slippage)
-         midPrice = transactionSign * sum(orderSides * prices) - totalSlippage
+         midPrice = transactionSign * float(np.dot(orderSides, prices)) - totalSlippage
          # Compute Bid-Ask spread
-         bidAskSpread = sum(list(map(self.contractUtils.bidAskSpread, contracts)))
+         bidAskSpread = float(np.sum(np.abs(askPrices - bidPrices)))
          # Keep track of the Limit order mid-price range
          position[f"{orderType}OrderMidPrice.Min"] = min(position[f"{orderType}OrderMidPrice.Min"], midPrice)
          position[f"{orderType}OrderMidPrice.Max"] = max(position[f"{orderType}OrderMidPrice.Max"], midPrice)
@@ -524,8 +577,8 @@ class OptionStrategyCore(OptionStrategyOrder):
       closeFillPrice = closeFillPrice or midPrice * np.sign(contractSide)
       
 
-      # Compute the Greeks (retrieve it as a dictionary)
-      greeks = self.bsm.computeGreeks(contract).__dict__
+      # Compute the Greeks (retrieve a copy as a dictionary, so the Greeks stored on the contract are not modified below)
+      greeks = self.bsm.computeGreeks(contract).asDict()
       # Add the midPrice and PnL values to the greeks dictionary to generalize the processing loop
       greeks["midPrice"] = midPrice
       
@@ -588,10 +641,12 @@ class OptionStrategyCore(OptionStrategyOrder):
       # Get the amount of credit received to open the position
       openPremium = position["open"]["premium"]
       orderQuantity = position["orderQuantity"]
+      # Get the slippage
+      slippage = parameters["slippage"]
 
       # Loop through all legs of the open position
       orderMidPrice = 0.0
-      limitOrderPrice = 0.0
+      totalSlippage = 0.0
       bidAskSpread = 0.0
       for contract in position["contracts"]:
          # Reverse the original contract side
@@ -601,11 +656,11 @@ class OptionStrategyCore(OptionStrategyOrder):
          # Get the latest mid-price
          midPrice = self.contractUtils.midPrice(contract)
          # Adjusted mid-price (including slippage)
-         adjustedMidPrice = midPrice + orderSide * parameters["slippage"]
+         adjustedMidPrice = midPrice + orderSide * slippage
          # Total order mid-price
          orderMidPrice -= orderSide * midPrice
-         # Total Limit order mid-price (including slippage)
-         limitOrderPrice -= orderSide * adjustedMidPrice
+         # Total slippage applied to the Limit order (orderSide * orderSide * slippage for each leg)
+         totalSlippage += orderSide * orderSide * slippage
          # Add the parameters needed to place a Market/Limit order if needed
          positionDetails["orderParameters"].append(
                {"symbol": contract.Symbol
@@ -615,25 +670,27 @@ class OptionStrategyCore(OptionStrategyOrder):
                }
             )
 
+      # Total Limit order mid-price (including slippage): derived from the order mid-price rather than accumulated separately for each leg
+      limitOrderPrice = orderMidPrice - totalSlippage
+
       # Check if the mid-price is positive: avoid closing the position if the Bid-Ask spread is too wide (more than 25% of the credit received)
       positionPnL = openPremium + orderMidPrice*orderQuantity
       if self.parameters["validateBidAskSpread"] and bidAskSpread > parameters["bidAskSpreadRatio"]*openPremium:
          self.logger.trace(f"The Bid-Ask spread is too wide. Open Premium: {openPremium},  Mid-Price: {orderMidPrice},  Bid-Ask Spread: {bidAskSpread}")
          positionPnL = None
 
-      # Set Order Id and expiration
-      positionDetails["orderId"] = position["orderId"]
-      positionDetails["expiryStr"] = position["expiryStr"]
-      # Set the order tag
-      positionDetails["orderTag"] = position["orderTag"]
-      # Store the full mid-price of the position
-      positionDetails["orderMidPrice"] = orderMidPrice
-      # Store the Limit Order mid-price of the position (including slippage)
-      positionDetails["limitOrderPrice"] = limitOrderPrice
-      # Store the full bid-ask spead of the position
-      positionDetails["bidAskSpread"] = bidAskSpread
-      # Store the position PnL
-      positionDetails["positionPnL"] = positionPnL
+      # Store the position details in a single update
+      positionDetails.update({"orderId": position["orderId"]
+                              , "expiryStr": position["expiryStr"]
+                              , "orderTag": position["orderTag"]
+                              # Full mid-price of the position
+                              , "orderMidPrice": orderMidPrice
+                              # Limit Order mid-price of the position (including slippage)
+                              , "limitOrderPrice": limitOrderPrice
+                              # Full bid-ask spead of the position
+                              , "bidAskSpread": bidAskSpread
+                              , "positionPnL": positionPnL
+                              })
 
       # Stop the timer
       self.context.executionTimer.stop()
@@ -18,7 +18,6 @@ from AlgorithmImports import *
 #                                                                                      #
 ########################################################################################
 
-import numpy as np
 from Logger import *
 from BSMLibrary import *
 from StrategyBuilder import *
@@ -27,23 +26,50 @@ from OptionStrategyOrderCore import *
 
 class OptionStrategyOrder(OptionStrategyOrderCore):
 
-   def getNakedOrder(self, contracts, type, strike = None, delta = None, fromPrice = None, toPrice = None, sell = True):
-      if sell:
-         # Short option contract
-         sides = [-1]
-         strategy = f"Short {type.title()}"
-      else:
-         # Long option contract
-         sides = [1]
-         strategy = f"Long {type.title()}"
+   # Sides of the contracts and strategy name of each order type, based on whether we are selling (True) or buying (False)
+   # Naked option: sides and prefix of the strategy name
+   nakedOrderSetup = {True: ((-1,), "Short")
+                      , False: ((1,), "Long")
+                      }
+   # Straddle/Strangle: [Put, Call]
+   straddleSides = {True: (-1, -1)
+                    , False: (1, 1)
+                    }
+   # Spread: sides and suffix of the strategy name
+   spreadOrderSetup = {True: ((-1, 1), "Credit Spread")
+                       , False: ((1, -1), "Debit Spread")
+                       }
+   # Iron Condor: 
+   #  - Sell: [longPut, shortPut, shortCall, longCall]
+   #  - Buy: [shortPut, longPut, longCall, shortCall]
+   ironCondorSetup = {True: ((1, -1, -1, 1), "Iron Condor")
+                      , False: ((-1, 1, 1, -1), "Reverse Iron Condor")
+                      }
+   # Iron Fly (same sides as the Iron Condor)
+   ironFlySetup = {True: ((1, -1, -1, 1), "Iron Fly")
+                   , False: ((-1, 1, 1, -1), "Reverse Iron Fly")
+                   }
+   # Butterfly: 
+   #  - Sell: [short<Put|Call>, 2 long<Put|Call>, short<Put|Call>]
+   #  - Buy: [long<Put|Call>, 2 short<Put|Call>, long<Put|Call>]
+   butterflySetup = {True: ((-1, 2, -1), "Credit Butterfly")
+                     , False: ((1, -2, 1), "Debit Butterfly")
+                     }
 
+   def getNakedOrder(self, contracts, type, strike = None, delta = None, fromPrice = None, toPrice = None, sell = True):
+      # Normalize the option type (only once)
       type = type.lower()
+      typeTitle = type.title()
+      # Short/Long option contract
+      sides, strategyPrefix = OptionStrategyOrder.nakedOrderSetup[bool(sell)]
+      strategy = f"{strategyPrefix} {typeTitle}"
+
       if type == "put":
          # Get all Puts with a strike lower than the given strike and delta lower than the given delta
-         sorted_contracts = self.strategyBuilder.getPuts(contracts, toDelta = delta, toStrike = strike, fromPrice = fromPrice, toPrice = toPrice)
+         sorted_contracts = self.strategyBuilder.getPuts(contracts, toDelta = delta, toStrike = strike, fromPrice = fromPrice, toPrice = toPrice, limit = 1)
       elif type == "call":
          # Get all Calls with a strike higher than the given strike and delta lower than the given delta
-         sorted_contracts = self.strategyBuilder.getCalls(contracts, toDelta = delta, fromStrike = strike, fromPrice = fromPrice, toPrice = toPrice)
+         sorted_contracts = self.strategyBuilder.getCalls(contracts, toDelta = delta, fromStrike = strike, fromPrice = fromPrice, toPrice = toPrice, limit = 1)
       else:
          self.logger.error(f"Input parameter type = {type} is invalid. Valid values: Put|Call.")
          return
@@ -59,36 +85,31 @@ class OptionStrategyOrder(OptionStrategyOrderCore):
    # Create order details for a Straddle order
    def getStraddleOrder(self, contracts, strike = None, netDelta = None, sell = True):
 
-      if sell:
-         # Short Straddle
-         sides = [-1, -1]
-      else:
-         # Long Straddle
-         sides = [1, 1]
+      # Short/Long Straddle
+      sides = OptionStrategyOrder.straddleSides[bool(sell)]
 
       # Delta strike selection (in case the Iron Fly is not centered on the ATM strike)
-      delta = None
-      # Make sure the netDelta is less than 50 
-      if netDelta != None and abs(netDelta) < 50:
-         delta = 50 + netDelta 
+      delta = self.netDeltaToLegDelta(netDelta)
 
       if strike == None and delta == None:
          # Standard Straddle: get the ATM contracts
          legs = self.strategyBuilder.getATM(contracts)
       else:
-         legs = []
+         legs = None
          # This is a Straddle centered at the given strike or Net Delta.          
          # Get the Put at the requested delta or strike
-         puts = self.strategyBuilder.getPuts(contracts, toDelta = delta, toStrike = strike)
-         if(len(puts) > 0):
+         puts = self.strategyBuilder.getPuts(contracts, toDelta = delta, toStrike = strike, limit = 1)
+         if puts:
             put = puts[0]
-
             # Get the Call at the same strike as the Put
-            calls = self.strategyBuilder.getCalls(contracts, fromStrike = put.Strike)
-            if(len(calls) > 0):
-               call = calls[0]
+            calls = self.strategyBuilder.getCalls(contracts, fromStrike = put.Strike, limit = 1)
+            if calls:
                # Collect both legs
-               legs = [put, call]
+               legs = (put, calls[0])
+
+      # Exit if we couldn't get both legs of the Straddle
+      if not legs:
+         return
 
       # Create order details
       order = self.getOrderDetails(legs, sides, "Straddle", sell)
@@ -99,22 +120,19 @@ class OptionStrategyOrder(OptionStrategyOrderCore):
    # Create order details for a Strangle order
    def getStrangleOrder(self, contracts, callDelta = None, putDelta = None, callStrike = None, putStrike = None, sell = True):
 
-      if sell:
-         # Short Strangle
-         sides = [-1, -1]
-      else:
-         # Long Strangle
-         sides = [1, 1]
+      # Short/Long Strangle
+      sides = OptionStrategyOrder.straddleSides[bool(sell)]
 
       # Get all Puts with a strike lower than the given putStrike and delta lower than the given putDelta
-      puts = self.strategyBuilder.getPuts(contracts, toDelta = putDelta, toStrike = putStrike)
+      puts = self.strategyBuilder.getPuts(contracts, toDelta = putDelta, toStrike = putStrike, limit = 1)
       # Get all Calls with a strike higher than the given callStrike and delta lower than the given callDelta
-      calls = self.strategyBuilder.getCalls(contracts, toDelta = callDelta, fromStrike = callStrike)
+      calls = self.strategyBuilder.getCalls(contracts, toDelta = callDelta, fromStrike = callStrike, limit = 1)
 
+      # Exit if we couldn't get both legs of the Strangle
+      if not (puts and calls):
+         return
       # Get the two contracts
-      legs = []
-      if len(puts) > 0 and len(calls) > 0:
-         legs = [puts[0], calls[0]]
+      legs = (puts[0], calls[0])
 
       # Create order details
       order = self.getOrderDetails(legs, sides, "Strangle", sell)
@@ -124,14 +142,11 @@ class OptionStrategyOrder(OptionStrategyOrderCore):
 
    def getSpreadOrder(self, contracts, type, strike = None, delta = None, wingSize = None, sell = True):
 
-      if sell:
-         # Credit Spread
-         sides = [-1, 1]
-         strategy = f"{type.title()} Credit Spread"
-      else:
-         # Debit Spread
-         sides = [1, -1]
-         strategy = f"{type.title()} Debit Spread"
+      # Get the option type description (only once)
+      typeTitle = type.title()
+      # Credit/Debit Spread
+      sides, strategySuffix = OptionStrategyOrder.spreadOrderSetup[bool(sell)]
+      strategy = f"{typeTitle} {strategySuffix}"
 
       # Get the legs of the spread
       legs = self.strategyBuilder.getSpread(contracts, type, strike = strike, delta = delta, wingSize = wingSize)
@@ -148,14 +163,8 @@ class OptionStrategyOrder(OptionStrategyOrderCore):
 
    def getIronCondorOrder(self, contracts, callDelta = None, putDelta = None, callStrike = None, putStrike = None, callWingSize = None, putWingSize = None, sell = True):
 
-      if sell:
-         # Sell Iron Condor: [longPut, shortPut, shortCall, longCall]
-         sides = [1, -1, -1, 1]
-         strategy = "Iron Condor"
-      else:
-         # Buy Iron Condor: [shortPut, longPut, longCall, shortCall]
-         sides = [-1, 1, 1, -1]
-         strategy = "Reverse Iron Condor"
+      # Sell/Buy Iron Condor
+      sides, strategy = OptionStrategyOrder.ironCondorSetup[bool(sell)]
 
       # Get the Put spread
       puts = self.strategyBuilder.getSpread(contracts, "Put", strike = putStrike, delta = putDelta, wingSize = putWingSize, sortByStrike = True)
@@ -177,20 +186,11 @@ class OptionStrategyOrder(OptionStrategyOrderCore):
 
    def getIronFlyOrder(self, contracts, netDelta = None, strike = None, callWingSize = None, putWingSize = None, sell = True):
 
-      if sell:
-         # Sell Iron Fly: [longPut, shortPut, shortCall, longCall]
-         sides = [1, -1, -1, 1]
-         strategy = "Iron Fly"
-      else:
-         # Buy Iron Fly: [shortPut, longPut, longCall, shortCall]
-         sides = [-1, 1, 1, -1]
-         strategy = "Reverse Iron Fly"
+      # Sell/Buy Iron Fly
+      sides, strategy = OptionStrategyOrder.ironFlySetup[bool(sell)]
 
       # Delta strike selection (in case the Iron Fly is not centered on the ATM strike)
-      delta = None
-      # Make sure the netDelta is less than 50 
-      if netDelta != None and abs(netDelta) < 50:
-         delta = 50 + netDelta 
+      delta = self.netDeltaToLegDelta(netDelta)
 
       if strike == None and delta == None:
          # Standard ATM Iron Fly
@@ -198,8 +198,13 @@ class OptionStrategyOrder(OptionStrategyOrderCore):
 
       # Get the Put spread
       puts = self.strategyBuilder.getSpread(contracts, "Put", strike = strike, delta = delta, wingSize = putWingSize, sortByStrike = True)      
+      # Exit if we couldn't get both legs of the Put spread
+      if len(puts) != 2:
+         return
+      # Get the middle strike (the short Put), read only once
+      middleStrike = puts[-1].Strike
       # Get the Call spread with the same strike as the first leg of the Put spread
-      calls = self.strategyBuilder.getSpread(contracts, "Call", strike = puts[-1].Strike, wingSize = callWingSize)
+      calls = self.strategyBuilder.getSpread(contracts, "Call", strike = middleStrike, wingSize = callWingSize)
 
       # Collect all legs
       legs = puts + calls
@@ -220,73 +225,30 @@ class OptionStrategyOrder(OptionStrategyOrderCore):
       leftWingSize = leftWingSize or rightWingSize or 1
       rightWingSize = rightWingSize or leftWingSize or 1
 
-      if sell:
-         # Sell Butterfly: [short<Put|Call>, 2 long<Put|Call>, short<Put|Call>]
-         sides = [-1, 2, -1]
-         strategy = "Credit Butterfly"
-      else:
-         # Buy Butterfly: [long<Put|Call>, 2 short<Put|Call>, long<Put|Call>]
-         sides = [1, -2, 1]
-         strategy = "Debit Butterfly"
+      # Sell/Buy Butterfly
+      sides, strategy = OptionStrategyOrder.butterflySetup[bool(sell)]
+
+      # Normalize the option type (only once)
+      type = type.lower()
+      typeTitle = type.title()
 
       # Create a custom description for each side to uniquely identify the wings:
       # Sell Butterfly: [leftShort<Put|Call>, 2 Long<Put|Call>, rightShort<Put|Call>]
       # Buy Butterfly: [leftLong<Put|Call>, 2 Short<Put|Call>, rightLong<Put|Call>]
-      optionSides = {-1: "Short", 1: "Long"}
-      sidesDesc = list(map(lambda side, prefix: f"{prefix}{optionSides[np.sign(side)]}{type.title()}", sides, ["left", "", "right"]))
+      sidesDesc = [f"{prefix}{'Long' if side > 0 else 'Short'}{typeTitle}" for side, prefix in zip(sides, ("left", "", "right"))]
       
       
       # Delta strike selection (in case the Butterfly is not centered on the ATM strike)
-      delta = None
-      # Make sure the netDelta is less than 50 
-      if netDelta != None and abs(netDelta) < 50:
-         if type.lower() == "put":
-            # Use Put delta
-            delta = 50 + netDelta
-         else:
-            # Use Call delta
-            delta = 50 - netDelta
+      delta = self.netDeltaToLegDelta(netDelta, useCallDelta = type != "put")
 
       if strike == None and delta == None:
          # Standard ATM Butterfly
          strike = self.strategyBuilder.getATMStrike(contracts)
 
-      type = type.lower()
-      if type == "put":
-         # Get the Put spread (sorted by strike in ascending order)
-         putSpread = self.strategyBuilder.getSpread(contracts, "Put", strike = strike, delta = delta, wingSize = leftWingSize, sortByStrike = True)
-         # Exit if we couldn't get all legs of the Iron Fly
-         if len(putSpread) != 2:
-            return
-         # Get the middle strike (second entry in the list)
-         middleStrike = putSpread[1].Strike
-         # Find the right wing of the Butterfly (add a small offset to the fromStrike in order to avoid selecting the middle strike as a wing)
-         wings = self.strategyBuilder.getPuts(contracts, fromStrike = middleStrike + 0.1, toStrike = middleStrike + rightWingSize)
-         # Exit if we could not find the wing
-         if len(wings) == 0:
-            return
-         # Combine all the legs
-         legs = putSpread + wings[0]
-      elif type == "call":
-         # Get the Call spread (sorted by strike in ascending order)
-         callSpread = self.strategyBuilder.getSpread(contracts, "Call", strike = strike, delta = delta, wingSize = rightWingSize)
-         # Exit if we couldn't get all legs of the Iron Fly
-         if len(callSpread) != 2:
-            return
-         # Get the middle strike (first entry in the list)
-         middleStrike = callSpread[0].Strike
-         # Find the left wing of the Butterfly (add a small offset to the toStrike in order to avoid selecting the middle strike as a wing)
-         wings = self.strategyBuilder.getCalls(contracts, fromStrike = middleStrike - leftWingSize, toStrike = middleStrike - 0.1)
-         # Exit if we could not find the wing
-         if len(wings) == 0:
-            return
-         # Combine all the legs
-         legs = wings[0] + callSpread
-      else:
-         self.logger.error(f"Input parameter type = {type} is invalid. Valid values: Put|Call.")
-         return
+      # Get the legs of the Butterfly, sorted by ascending strike: [leftWing, middle, rightWing]
+      legs = self.strategyBuilder.getButterflyLegs(contracts, type, strike = strike, delta = delta, leftWingSize = leftWingSize, rightWingSize = rightWingSize)
 
-      # Exit if we couldn't get both legs of the spread
+      # Exit if we couldn't get all legs of the Butterfly
       if len(legs) != 3:
          return
 
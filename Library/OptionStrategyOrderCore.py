@@ -19,18 +19,60 @@ from AlgorithmImports import *
 ########################################################################################
 
 import numpy as np
+from types import MappingProxyType
+from functools import partial
 from Logger import *
 from BSMLibrary import *
 from StrategyBuilder import *
 from ContractUtils import *
+from NumbaKernels import *
 
 class OptionStrategyOrderCore:
 
    # Internal counter for all the orders
    orderCount = 0
 
-   # Default parameters
-   defaultParameters = {
+   # Lookup table used to create the description of each contract: (isLong, Right) -> <long|short><Call|Put>
+   # The descriptions are constant strings (their hash is computed only once), shared as dictionary keys by all the orders
+   contractDesc = {(True, OptionRight.Put): "longPut"
+                   , (False, OptionRight.Put): "shortPut"
+                   , (True, OptionRight.Call): "longCall"
+                   , (False, OptionRight.Call): "shortCall"
+                   }
+   # Integer value of the Call option right (compare the raw integer values rather than the enum objects)
+   optionRightCall = int(OptionRight.Call)
+
+   # Name of the method used to build the orders (i.e. "getNakedOrder"). Must be set by the inheriting class, unless getOrder is overridden
+   orderBuilder = None
+   # Fixed arguments of the order builder method (i.e. the option type: {"type": "Put"})
+   orderConstants = {}
+   # Arguments of the order builder method that are set from the strategy parameters: <argument>: <parameter key>.
+   # Every parameter key must be defined (either in the default parameters or when creating the strategy), otherwise the constructor raises a KeyError.
+   # The values are read only once, when the strategy is created (see self.orderArgs): changing self.parameters afterwards has no effect on the orders
+   orderParameters = {}
+
+   # Cache of the Strategy Id for each strategy name (i.e. "Iron Condor" -> "IronCondor")
+   strategyIds = {}
+
+   # Greeks stored for each leg of the order. Defines the column layout of the order["greeks"] array
+   greekNames = ("delta", "gamma", "vega", "theta", "rho", "vomma", "elasticity")
+   greekIndex = {greek: idx for idx, greek in enumerate(greekNames)}
+
+   # Initial status of the open/close orders (read-only templates: each order gets its own copy, with a new list of orders)
+   openOrderTemplate = MappingProxyType({"fills": 0
+                                         , "filled": False
+                                         , "stalePrice": False
+                                         , "fillPrice": 0.0
+                                         })
+   closeOrderTemplate = MappingProxyType({"fills": 0
+                                          , "filled": False
+                                          , "stalePrice": False
+                                          , "orderMidPrice": 0.0
+                                          , "fillPrice": 0.0
+                                          })
+
+   # Default parameters (read-only view: each strategy gets its own copy)
+   defaultParameters = MappingProxyType({
       "creditStrategy": True
       , "maxActivePositions": None
       , "maxOrderQuantity": 1
@@ -84,6 +126,8 @@ class OptionStrategyOrderCore:
       , "butteflyType": None
       , "butterflyLeftWingSize": 10
       , "butterflyRightWingSize": 10
+      # Custom strategy: description of each leg (optional, derived from the contract type and side if not specified)
+      , "sidesDesc": None
       # If True, the order is submitted as long as it does not exceed the maxOrderQuantity.
       , "validateQuantity": True
       # If True, the order mid-price is validated to make sure the Bid-Ask spread is not too wide.
@@ -110,7 +154,7 @@ class OptionStrategyOrderCore:
       , "emaMemory": 200
       # Ensures that the Stop Loss does not exceed the theoretical loss. (Set to False for Credit Calendars)
       , "capStopLoss": True
-   }
+   })
 
    @staticmethod
    def getNextOrderId():
@@ -143,18 +187,32 @@ class OptionStrategyOrderCore:
       self.strategyBuilder = StrategyBuilder(context)
 
       # Initialize the parameters dictionary with the default values
-      self.parameters = OptionStrategyOrderCore.defaultParameters.copy()
+      self.parameters = dict(OptionStrategyOrderCore.defaultParameters)
+      # Get the list of attributes of the context (only once, rather than checking each parameter with hasattr)
+      contextAttributes = set(dir(context))
       # Override default parameters with values that might have been set in the context
-      for key in self.parameters:
-         if hasattr(context, key):
-            self.parameters[key] = getattr(context, key)
+      for key in OptionStrategyOrderCore.defaultParameters.keys() & contextAttributes:
+         self.parameters[key] = getattr(context, key)
       # Now merge the dictionary with any kwargs parameters that might have been specified directly with the constructor (kwargs takes precedence)
       self.parameters.update(kwargs)
+      # Get the value of the arguments used to build each order. The arguments are frozen at this point: they are only looked up once (any missing parameter raises a KeyError here)
+      self.orderArgs = dict(self.orderConstants)
+      self.orderArgs.update({arg: self.parameters[key] for arg, key in self.orderParameters.items()})
+      # Bind the order builder method (resolved only once, rather than on each call to getOrder)
+      self.buildOrder = getattr(self, self.orderBuilder) if self.orderBuilder else None
+      # Specialize getOrder for this strategy: bind the order builder together with its arguments, so each call is a single function call (unless getOrder is overridden by the inheriting class)
+      if self.buildOrder != None and type(self).getOrder is OptionStrategyOrderCore.getOrder:
+         self.getOrder = partial(self.buildOrder, **self.orderArgs)
+
+      # Cache of the last trading day (and the market close cutoff date/time) for each expiration date
+      self.lastTradingDayCache = {}
+      # Cache of the formatted string (YYYY-MM-DD) of each expiration date
+      self.expiryStrCache = {}
 
       # Determine what is the last trading day of the backtest
       self.endOfBacktestCutoffDttm = None
       if hasattr(context, "EndDate") and context.EndDate != None:
-         self.endOfBacktestCutoffDttm = datetime.combine(self.lastTradingDay(context.EndDate), self.parameters["marketCloseCutoffTime"])
+         _, self.endOfBacktestCutoffDttm = self.lastTradingDayCutoff(context.EndDate)
       
       # Create dictionary to keep track of all the open positions related to this strategy
       self.openPositions = {}
@@ -181,9 +239,11 @@ class OptionStrategyOrderCore:
    def updateCharts(self):
       pass
       
-   # Interface method. Must be implemented by the inheriting class
+   # Create the order for the given chain using the order builder method. Can be overridden by the inheriting class
+   # (when not overridden, it is replaced in __init__ by the order builder with its arguments already bound)
    def getOrder(self, chain):
-      pass
+      if self.buildOrder != None:
+         return self.buildOrder(chain, **self.orderArgs)
    
    def getMaxOrderQuantity(self):
       # Get the context
@@ -205,12 +265,60 @@ class OptionStrategyOrderCore:
       return maxOrderQuantity
 
 
+   # Returns the Strategy Id (strategy name without spaces). The strategy names are a fixed set, so the result is cached
+   @staticmethod
+   def getStrategyId(strategy):
+      strategyIds = OptionStrategyOrderCore.strategyIds
+      strategyId = strategyIds.get(strategy)
+      if strategyId == None:
+         strategyId = strategyIds[strategy] = strategy.replace(" ", "")
+      return strategyId
+
+   # Convert the net delta of a position into the delta of the leg used to select the strike (in case the position is not centered on the ATM strike). 
+   # Returns None if no netDelta is specified or if it's not less than 50
+   #  - Put leg: delta = 50 + netDelta
+   #  - Call leg: delta = 50 - netDelta
+   @staticmethod
+   def netDeltaToLegDelta(netDelta, useCallDelta = False):
+      # Make sure the netDelta is less than 50 
+      if netDelta is None or abs(netDelta) >= 50:
+         return None
+      if useCallDelta:
+         return 50 - netDelta
+      else:
+         return 50 + netDelta
+
    def lastTradingDay(self, expiry):
+      # Get the last trading day for the given expiration date
+      lastDay, _ = self.lastTradingDayCutoff(expiry)
+      return lastDay
+
+   # Returns a tuple (lastTradingDay, marketCloseCutoffDttm) with the last trading day for the given expiration date
+   # and the date/time threshold by which any position must be closed on that day
+   def lastTradingDayCutoff(self, expiry):
+      # Check if we have already processed this expiration date
+      cutoff = self.lastTradingDayCache.get(expiry)
+      if cutoff != None:
+         return cutoff
       # Get the trading calendar
       tradingCalendar = self.context.TradingCalendar
-      # Find the last trading day for the given expiration date
-      lastDay = list(tradingCalendar.GetDaysByType(TradingDayType.BusinessDay, expiry - timedelta(days = 20), expiry))[-1].Date
-      return lastDay
+      # Find the last trading day for the given expiration date (only keep the last entry, no need to build the full list)
+      lastDay = None
+      for tradingDay in tradingCalendar.GetDaysByType(TradingDayType.BusinessDay, expiry - timedelta(days = 20), expiry):
+         lastDay = tradingDay.Date
+      # Set the date/time threshold by which the position must be closed
+      cutoff = (lastDay, datetime.combine(lastDay, self.parameters["marketCloseCutoffTime"]))
+      # Store it in the cache
+      self.lastTradingDayCache[expiry] = cutoff
+      return cutoff
+
+   # Get the expiration date formatted as a string (YYYY-MM-DD). There are only a few distinct expiration dates, so each one is formatted only once
+   def getExpiryStr(self, expiry):
+      expiryStr = self.expiryStrCache.get(expiry)
+      if expiryStr == None:
+         expiryStr = expiry.strftime("%Y-%m-%d")
+         self.expiryStrCache[expiry] = expiryStr
+      return expiryStr
 
    def isDuplicateOrder(self, contracts, sides):
       # Loop through all working orders of this strategy
@@ -234,7 +342,7 @@ class OptionStrategyOrderCore:
                expiryStr = contractInfo.get("expiryStr")
                # Check for a mismatch
                if (orderSide != side # Found the contract but it's on a different side (Sell/Buy)
-                   or expiryStr != contract.Expiry.strftime("%Y-%m-%d") # Found the contract but it's on a different Expiry
+                   or expiryStr != self.getExpiryStr(contract.Expiry) # Found the contract but it's on a different Expiry
                    ):
                   # It's not a duplicate. Brake this innermost loop 
                   isDuplicate = False
@@ -263,14 +371,31 @@ class OptionStrategyOrderCore:
       parameters = self.parameters
 
       # Set the Strategy Id (if not specified)
-      strategyId = strategyId or strategy.replace(" ", "")
+      strategyId = strategyId or self.getStrategyId(strategy)
 
       # Get the Expiration from the first contract (unless otherwise specified
       expiry = expiry or contracts[0].Expiry
-      # Get the last trading day for the given expiration date (in case it falls on a holiday)
-      expiryLastTradingDay = self.lastTradingDay(expiry)
-      # Set the date/time threshold by which the position must be closed (on the last trading day before expiration)
-      expiryMarketCloseCutoffDttm = datetime.combine(expiryLastTradingDay, parameters["marketCloseCutoffTime"])
+      # Get the last trading day for the given expiration date (in case it falls on a holiday) and 
+      # the date/time threshold by which the position must be closed (on the last trading day before expiration)
+      expiryLastTradingDay, expiryMarketCloseCutoffDttm = self.lastTradingDayCutoff(expiry)
+
+      # Get the slippage parameter (if available)
+      slippage = parameters["slippage"] or 0.0
+
+      # Get the security of each contract (a single lookup for each leg)
+      securities = [self.contractUtils.getSecurity(contract) for contract in contracts]
+      # Collect the Bid/Ask prices and the sides of all legs into arrays
+      bidPrices = np.array([security.BidPrice for security in securities], dtype = np.float64)
+      askPrices = np.array([security.AskPrice for security in securities], dtype = np.float64)
+      sidesArray = np.array(sides, dtype = np.float64)
+      # Compute the mid-price of each leg and the Mid-Price, Bid-Ask spread and number of contracts of the full order (compiled kernel)
+      legMidPrices, orderMidPrice, bidAskSpread, totalQuantity = orderPricesKernel(sidesArray, bidPrices, askPrices)
+      # Exit if the order has no value (i.e. stale or zero quotes): the order would be rejected anyway, no need to build the order details
+      if abs(orderMidPrice) < 1e-5:
+         return
+      # Compute the total slippage
+      totalSlippage = totalQuantity * slippage
+
       # Dictionary to map each contract symbol to the side (short/long) 
       contractSide = {}
       # Dictionary to map each contract symbol to its decription 
@@ -278,28 +403,17 @@ class OptionStrategyOrderCore:
       # Dictionary to map each contract symbol to the actual contract object
       contractDictionary = {}
       
-      # Dictionaries to keep track of all the strikes, Delta and IV
+      # Dictionaries to keep track of all the strikes and IV
       strikes = {}
-      delta = {}
-      gamma = {}
-      vega = {}
-      theta = {}
-      rho = {}
-      vomma = {}
-      elasticity = {}
       IV = {}
+      # Array with the Greeks of each leg (one row for each contract, columns are defined by greekNames)
+      legGreeks = np.empty((len(contracts), len(OptionStrategyOrderCore.greekNames)), dtype = np.float64)
       midPrices = {}
       contractExpiry = {}
 
       # Compute the Greeks for each contract (if not already available)
       self.bsm.setGreeks(contracts)
       
-      # Compute the Mid-Price and Bid-Ask spread for the full order
-      orderMidPrice = 0.0
-      bidAskSpread = 0.0
-      # Get the slippage parameter (if available)
-      slippage = parameters["slippage"] or 0.0
-         
       # Get the limitOrderRelativePriceAdjustment
       limitOrderRelativePriceAdjustment = parameters["limitOrderRelativePriceAdjustment"] or 0.0
       # Get the limitOrderAbsolutePrice 
@@ -321,11 +435,10 @@ class OptionStrategyOrderCore:
 
       # Check if we have a description for the contracts
       if sidesDesc == None:
-         # Temporary dictionaries to lookup a description
-         optionTypeDesc = {OptionRight.Put: "Put", OptionRight.Call: "Call"}
-         optionSideDesc = {-1: "short", 1: "long"}
+         # Get the lookup table
+         contractDesc = OptionStrategyOrderCore.contractDesc
          # create a description for each contract: <long|short><Call|Put>
-         sidesDesc = list(map(lambda contract, side: f"{optionSideDesc[np.sign(side)]}{optionTypeDesc[contract.Right]}", contracts, sides))
+         sidesDesc = [contractDesc[(side > 0, contract.Right)] for contract, side in zip(contracts, sides)]
 
       n = 0
       for contract in contracts:
@@ -334,55 +447,40 @@ class OptionStrategyOrderCore:
          # Contract description (<long|short><Call|Put>)
          orderSideDesc = sidesDesc[n]
          
+         # Get the contract Symbol and Greeks (fetch them only once)
+         symbol = contract.Symbol
+         greeks = contract.BSMGreeks
+
          # Store it in the dictionary
-         contractSide[contract.Symbol] = orderSide
-         contractSideDesc[contract.Symbol] = orderSideDesc
-         contractDictionary[contract.Symbol] = contract
+         contractSide[symbol] = orderSide
+         contractSideDesc[symbol] = orderSideDesc
+         contractDictionary[symbol] = contract
 
          # Set the strike in the dictionary -> "<short|long><Call|Put>": <strike>
-         strikes[f"{orderSideDesc}"] = contract.Strike
-         contractExpiry[f"{orderSideDesc}"] = contract.Expiry
-         # Set the Greeks and IV in the dictionary -> "<short|long><Call|Put>": <greek|IV>
-         delta[f"{orderSideDesc}"] = contract.BSMGreeks.Delta
-         gamma[f"{orderSideDesc}"] = contract.BSMGreeks.Gamma
-         vega[f"{orderSideDesc}"] = contract.BSMGreeks.Vega
-         theta[f"{orderSideDesc}"] = contract.BSMGreeks.Theta
-         rho[f"{orderSideDesc}"] = contract.BSMGreeks.Rho
-         vomma[f"{orderSideDesc}"] = contract.BSMGreeks.Vomma
-         elasticity[f"{orderSideDesc}"] = contract.BSMGreeks.Elasticity
-         IV[f"{orderSideDesc}"] = contract.BSMImpliedVolatility
+         strikes[orderSideDesc] = contract.Strike
+         contractExpiry[orderSideDesc] = contract.Expiry
+         # Set the Greeks of the contract (same order as greekNames)
+         legGreeks[n] = (greeks.Delta, greeks.Gamma, greeks.Vega, greeks.Theta, greeks.Rho, greeks.Vomma, greeks.Elasticity)
+         # Set the IV in the dictionary -> "<short|long><Call|Put>": <IV>
+         IV[orderSideDesc] = contract.BSMImpliedVolatility
 
          # Get the latest mid-price
-         midPrice = self.contractUtils.midPrice(contract)
+         midPrice = float(legMidPrices[n])
          # Store the midPrice in the dictionary -> "<short|long><Call|Put>": midPrice
-         midPrices[f"{orderSideDesc}"] = midPrice
-         # Compute the bid-ask spread
-         bidAskSpread += self.contractUtils.bidAskSpread(contract)         
-         # Adjusted mid-price (include slippage). Take the sign of orderSide to determine the direction of the adjustment
-         adjustedMidPrice = midPrice + np.sign(orderSide) * slippage
-         # Keep track of the total credit/debit or the order
-         orderMidPrice -= orderSide * midPrice
+         midPrices[orderSideDesc] = midPrice
 
          # Increment counter
          n += 1
       
-      # Compute Limit Order price
-      if limitOrderAbsolutePrice != None:
-         if abs(orderMidPrice) < 1e-5:
-            limitOrderRelativePriceAdjustment = 0
-         else:
-            # Compute the relative price adjustment (needed to adjust each leg with the same proportion)
-            limitOrderRelativePriceAdjustment = limitOrderAbsolutePrice / orderMidPrice - 1
+      # Compute Limit Order price (including slippage)
+      if limitOrderAbsolutePrice is not None:
          # Use the specified absolute price
-         limitOrderPrice = limitOrderAbsolutePrice
+         limitOrderPrice = limitOrderAbsolutePrice - totalSlippage
+         # Keep track of the equivalent relative price adjustment (orderMidPrice is non-zero at this point)
+         limitOrderRelativePriceAdjustment = limitOrderAbsolutePrice / orderMidPrice - 1
       else:
-         # Set the Limit Order price (including slippage)
-         limitOrderPrice = orderMidPrice * (1 + limitOrderRelativePriceAdjustment)
-
-      # Compute the total slippage
-      totalSlippage = sum(list(map(abs, sides))) * slippage
-      # Add slippage to the limit order
-      limitOrderPrice -= totalSlippage
+         # Apply the relative price adjustment to the mid-price
+         limitOrderPrice = orderMidPrice * (1 + limitOrderRelativePriceAdjustment) - totalSlippage
 
       # Round the prices to the nearest cent
       orderMidPrice = round(orderMidPrice, 2)
@@ -403,35 +501,21 @@ class OptionStrategyOrderCore:
          # Make sure we are not exceeding the available portfolio margin
          targetPremium = min(context.Portfolio.MarginRemaining, targetPremium)
 
-         # Determine the order quantity based on the target premium
-         if abs(qtyMidPrice) <= 1e-5:
+         # Determine the order quantity based on the target premium (this is a non-negative number)
+         absQtyMidPrice = abs(qtyMidPrice)
+         if absQtyMidPrice <= 1e-5:
             orderQuantity = 1
          else:
-            orderQuantity = abs(targetPremium / (qtyMidPrice * 100))
+            orderQuantity = abs(targetPremium) / (absQtyMidPrice * 100.0)
          
          # Different logic for Credit vs Debit strategies
          if sell: # Credit order
             # Sell at least one contract
             orderQuantity = max(1, round(orderQuantity))
          else: # Debit order
-            # Make sure the total price does not exceed the target premium
-            orderQuantity = math.floor(orderQuantity)
-
-
-      # Internal function to evaluate the P&L of the position
-      def fValue(spotPrice, contracts, sides = None, atTime = None, openPremium = None):
-         # Compute the theoretical value at the given Spot price and point in time
-         prices = np.array([self.bsm.bsmPrice(contract
-                                              , sigma = contract.BSMImpliedVolatility
-                                              , spotPrice = spotPrice
-                                              , atTime = atTime
-                                              )
-                              for contract in contracts
-                            ]
-                           )
-         # Total value of the position
-         value = openPremium + sum(prices * np.array(sides))
-         return value
+            # Make sure the total price does not exceed the target premium (int() truncates, which is the same as floor for non-negative numbers)
+            orderQuantity = int(orderQuantity)
+
 
       # Get the current price of the underlying
       security = context.Securities[context.underlyingSymbol]
@@ -447,14 +531,14 @@ class OptionStrategyOrderCore:
       portfolioMarginStress = parameters.get("portfolioMarginStress")
       # Compute the projected P&L of the position following a % movement of the underlying up or down
       portfolioMargin = min(0
-                            , fValue(underlyingPrice * (1-portfolioMarginStress), contracts, sides = sides, atTime = context.Time, openPremium = midPrice)
-                            , fValue(underlyingPrice * (1+portfolioMarginStress), contracts, sides = sides, atTime = context.Time, openPremium = midPrice)
+                            , self.getPositionValueAt(underlyingPrice * (1-portfolioMarginStress), contracts, sides = sides, atTime = context.Time, openPremium = midPrice)
+                            , self.getPositionValueAt(underlyingPrice * (1+portfolioMarginStress), contracts, sides = sides, atTime = context.Time, openPremium = midPrice)
                             ) * orderQuantity
 
 
       # Create order details
       order = {"expiry": expiry
-               , "expiryStr": expiry.strftime("%Y-%m-%d")
+               , "expiryStr": self.getExpiryStr(expiry)
                , "expiryLastTradingDay": expiryLastTradingDay
                , "expiryMarketCloseCutoffDttm": expiryMarketCloseCutoffDttm
                , "strategyId": strategyId
@@ -467,13 +551,7 @@ class OptionStrategyOrderCore:
                , "contractDictionary": contractDictionary
                , "strikes": strikes
                , "midPrices": midPrices
-               , "delta": delta
-               , "gamma": gamma
-               , "vega": vega
-               , "theta": theta
-               , "rho": rho
-               , "vomma": vomma
-               , "elasticity": elasticity
+               , "greeks": legGreeks
                , "IV": IV
                , "contracts": contracts
                , "targetPremium": targetPremium
@@ -484,9 +562,7 @@ class OptionStrategyOrderCore:
                , "TReg": TReg
                , "portfolioMargin": portfolioMargin
                , "open": {"orders": []
-                          , "fills": 0
-                          , "filled": False
-                          , "stalePrice": False
+                          , **OptionStrategyOrderCore.openOrderTemplate
                           , "limitOrderAdjustment": limitOrderRelativePriceAdjustment
                           , "orderMidPrice": orderMidPrice
                           , "limitOrderPrice": limitOrderPrice
@@ -496,14 +572,9 @@ class OptionStrategyOrderCore:
                           , "slippage": slippage
                           , "totalSlippage": totalSlippage
                           , "bidAskSpread": bidAskSpread
-                          , "fillPrice": 0.0
                           }
                , "close": {"orders": []
-                           , "fills": 0
-                           , "filled": False
-                           , "stalePrice": False
-                           , "orderMidPrice": 0.0
-                           , "fillPrice": 0.0
+                           , **OptionStrategyOrderCore.closeOrderTemplate
                            }
             }
 
@@ -515,7 +586,7 @@ class OptionStrategyOrderCore:
       if profitTargetMethod != "premium":
          if profitTargetMethod == "theta" and thetaProfitDays > 0:
             # Calculate the P&L of the position at T+[thetaProfitDays]
-            thetaPnL = fValue(underlyingPrice, contracts, sides = sides, atTime = context.Time + timedelta(days = thetaProfitDays), openPremium = midPrice)
+            thetaPnL = self.getPositionValueAt(underlyingPrice, contracts, sides = sides, atTime = context.Time + timedelta(days = thetaProfitDays), openPremium = midPrice)
             # Profit target is a percentage of the P&L calculated at T+[thetaProfitDays]
             profitTargetAmt = profitTargetPct * abs(thetaPnL) * orderQuantity
          elif profitTargetMethod == "treg":
@@ -532,46 +603,125 @@ class OptionStrategyOrderCore:
       return order
 
 
+   # Returns two arrays with the strikes and the directions (Call -> +1, Put -> -1) of the given contracts
+   @staticmethod
+   def getStrikesAndDirections(contracts):
+      strikes = np.array([contract.Strike for contract in contracts], dtype = np.float64)
+      rights = np.array([int(contract.Right) for contract in contracts])
+      directions = np.where(rights == OptionStrategyOrderCore.optionRightCall, 1.0, -1.0)
+      return strikes, directions
+
+   # Evaluate the P&L of the position: theoretical value of the contracts at the given Spot price and point in time
+   def getPositionValueAt(self, spotPrice, contracts, sides = None, atTime = None, openPremium = None):
+      # Compute the theoretical value of each contract
+      prices = np.array([self.bsm.bsmPrice(contract
+                                           , sigma = contract.BSMImpliedVolatility
+                                           , spotPrice = spotPrice
+                                           , atTime = atTime
+                                           )
+                           for contract in contracts
+                         ]
+                        )
+      # Total value of the position
+      value = openPremium + sum(prices * np.array(sides))
+      return value
+
    def getPayoff(self, spotPrice, contracts, sides):
       # Exit if there are no contracts to process
-      if len(contracts) == 0:
+      if not contracts:
          return 0
 
-      # Initialize the counter
-      n = 0
-      # initialize the payoff
-      payoff = 0
-      for contract in contracts:
-         # direction: Call -> +1, Put -> -1
-         direction = 2*int(contract.Right == OptionRight.Call)-1
-         # Add the payoff of the current contract
-         payoff += sides[n] * max(0, direction * (spotPrice - contract.Strike))
-         # Increment the counter
-         n += 1
+      # Extract the strikes and the directions (Call -> +1, Put -> -1) of all contracts
+      strikes, directions = self.getStrikesAndDirections(contracts)
+      # The spot price can be either a single value or an array of values (the payoff is computed for each spot price)
+      spotPrices = np.asarray(spotPrice, dtype = np.float64)
+      # Compute the payoff of each contract (broadcast each spot price across all contracts) and sum them based on their side
+      payoff = np.maximum(0.0, directions * (spotPrices[..., np.newaxis] - strikes)) @ np.array(sides, dtype = np.float64)
 
-      # Return the payoff
+      # Return the payoff (a scalar if a single spot price was provided)
+      if payoff.ndim == 0:
+         return float(payoff)
       return payoff
       
    def computeOrderMaxLoss(self, contracts, sides):
       # Exit if there are no contracts to process
-      if len(contracts) == 0:
+      if not contracts:
          return 0
 
+      # Use the closed-form formula if the order matches one of the common strategy shapes
+      maxLoss = self.getClosedFormMaxLoss(contracts, sides)
+      if maxLoss != None:
+         return maxLoss
+
       # Get the current price of the underlying
       UnderlyingLastPrice = self.contractUtils.getUnderlyingLastPrice(contracts[0])
-      # Evaluate the payoff at the extreme (spotPrice = 0)
-      maxLoss = self.getPayoff(0, contracts, sides)
-      # Evaluate the payoff at each strike
-      for contract in contracts:
-         maxLoss = min(maxLoss, self.getPayoff(contract.Strike, contracts, sides))
-
-      # Evaluate the payoff at the extreme (spotPrice = 10x higher)
-      maxLoss = min(maxLoss, self.getPayoff(UnderlyingLastPrice*10, contracts, sides))      
-      # Cap the payoff at zero: we are only interested in losses
-      maxLoss = min(0, maxLoss)
+      # Extract the strikes and the directions (Call -> +1, Put -> -1) of all contracts
+      strikes, directions = self.getStrikesAndDirections(contracts)
+      # Evaluate the payoff at the extremes and at each strike (compiled kernel)
+      maxLoss = maxLossKernel(float(UnderlyingLastPrice), strikes, directions, np.array(sides, dtype = np.float64))
       # Return the max loss
       return maxLoss
 
+   # Max loss of a vertical spread (two contracts of the same type with opposite sides of the same size)
+   # The payoff is monotonic between the two strikes, so the max loss is found at one of the extremes:
+   #  - Put spread: at spotPrice = 0
+   #  - Call spread: at spotPrice -> Inf
+   def getVerticalMaxLoss(self, contracts, sides):
+      # Make sure this is a vertical spread
+      if (len(contracts) != 2
+          or contracts[0].Right != contracts[1].Right
+          or sides[0] + sides[1] != 0
+          ):
+         return
+      # Get the strikes
+      firstStrike = contracts[0].Strike
+      secondStrike = contracts[1].Strike
+      if contracts[0].Right == OptionRight.Call:
+         # Payoff of the Call spread when the underlying goes to infinity
+         payoff = sides[0] * (secondStrike - firstStrike)
+      else:
+         # Payoff of the Put spread when the underlying goes to zero
+         payoff = sides[0] * (firstStrike - secondStrike)
+      # Cap the payoff at zero: we are only interested in losses
+      return min(0, payoff)
+
+   # Returns the max loss of the order using a closed-form formula for the following strategy shapes:
+   #  - Naked Put and Long Call
+   #  - Vertical spreads (Put or Call)
+   #  - Iron Condor/Fly (either side): Put spread + Call spread, with all the Put strikes below the Call strikes
+   # Returns None for any other shape (the max loss must then be computed by scanning the payoff)
+   def getClosedFormMaxLoss(self, contracts, sides):
+      # Number of legs
+      nLegs = len(contracts)
+
+      if nLegs == 1:
+         contract = contracts[0]
+         if contract.Right == OptionRight.Put:
+            # Naked Put: the max loss happens when the underlying goes to zero
+            return min(0, sides[0] * contract.Strike)
+         elif sides[0] > 0:
+            # Long Call: there is no loss at expiration (excluding the premium)
+            return 0
+      elif nLegs == 2:
+         return self.getVerticalMaxLoss(contracts, sides)
+      elif nLegs == 4:
+         # Make sure this is a Put spread followed by a Call spread, with the Put spread below the Call spread: [Put, Put, Call, Call]
+         if (contracts[0].Right == OptionRight.Put
+             and contracts[1].Right == OptionRight.Put
+             and contracts[2].Right == OptionRight.Call
+             and contracts[3].Right == OptionRight.Call
+             and max(contracts[0].Strike, contracts[1].Strike) <= min(contracts[2].Strike, contracts[3].Strike)
+             ):
+            # Get the max loss of each spread
+            putMaxLoss = self.getVerticalMaxLoss(contracts[0:2], sides[0:2])
+            callMaxLoss = self.getVerticalMaxLoss(contracts[2:4], sides[2:4])
+            # The two spreads cannot lose at the same time: the max loss is the largest of the two
+            if putMaxLoss != None and callMaxLoss != None:
+               return min(putMaxLoss, callMaxLoss)
+
+      # No closed-form formula available for this order
+      return None
+
    def getCustomOrder(self, contracts, types, deltas = None, sides = None, sidesDesc = None, strategy = "Custom", sell = None):
 
       # Make sure the Sides parameter has been specified
@@ -596,13 +746,13 @@ class OptionStrategyOrderCore:
       legs = []
       midPrice = 0
       for side, type, delta in zip(sides, types, deltas):
-         # Get all Puts with a strike lower than the given putStrike and delta lower than the given putDelta
-         deltaContracts = self.strategyBuilder.getContracts(contracts, type = type, toDelta = delta, reverse = type.lower() == "put")
+         # Get the first Put/Call with a delta lower than the given delta (only the first contract is needed: no need to retrieve the whole list)
+         deltaContracts = self.strategyBuilder.getContracts(contracts, type = type, toDelta = delta, reverse = type.lower() == "put", limit = 1)
          # Exit if we could not find the contract
          if not deltaContracts:
             return
          # Append the contract to the list of legs
-         legs = legs + [deltaContracts[0]]
+         legs.append(deltaContracts[0])
          # Update the mid-price
          midPrice -= self.contractUtils.midPrice(deltaContracts[0]) * side
       
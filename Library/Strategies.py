@@ -20,144 +20,134 @@ from AlgorithmImports import *
 from OptionStrategy import *
 from System.Drawing import Color
 
+# Order builder of each strategy type: <strategy type>: (<order builder method>, <fixed arguments>, <arguments set from the strategy parameters>)
+strategyTable = {"Put": ("getNakedOrder", {"type": "Put"}, {"delta": "delta", "sell": "creditStrategy"})
+                 , "Call": ("getNakedOrder", {"type": "Call"}, {"delta": "delta", "sell": "creditStrategy"})
+                 , "Straddle": ("getStraddleOrder", {}, {"netDelta": "netDelta", "sell": "creditStrategy"})
+                 , "Strangle": ("getStrangleOrder", {}, {"callDelta": "callDelta", "putDelta": "putDelta", "sell": "creditStrategy"})
+                 , "PutSpread": ("getSpreadOrder", {"type": "Put"}, {"delta": "delta", "wingSize": "wingSize", "sell": "creditStrategy"})
+                 , "CallSpread": ("getSpreadOrder", {"type": "Call"}, {"delta": "delta", "wingSize": "wingSize", "sell": "creditStrategy"})
+                 , "IronCondor": ("getIronCondorOrder", {}, {"callDelta": "callDelta", "putDelta": "putDelta", "callWingSize": "callWingSize", "putWingSize": "putWingSize", "sell": "creditStrategy"})
+                 , "IronFly": ("getIronFlyOrder", {}, {"netDelta": "netDelta", "callWingSize": "callWingSize", "putWingSize": "putWingSize", "sell": "creditStrategy"})
+                 , "Butterfly": ("getButterflyOrder", {}, {"netDelta": "netDelta", "type": "butteflyType", "leftWingSize": "butterflyLeftWingSize", "rightWingSize": "butterflyRightWingSize", "sell": "creditStrategy"})
+                 , "Custom": ("getCustomOrder", {}, {"types": "types", "deltas": "deltas", "sides": "sides", "sidesDesc": "sidesDesc", "sell": "creditStrategy"})
+                 }
+
+
 class PutStrategy(OptionStrategy):
-   def getOrder(self, chain):
-      return self.getNakedOrder(chain
-                                , "Put"
-                                , delta = self.parameters["delta"]
-                                , sell = self.parameters["creditStrategy"]
-                                )
+   orderBuilder, orderConstants, orderParameters = strategyTable["Put"]
 
 
 class CallStrategy(OptionStrategy):
-   def getOrder(self, chain):
-      return self.getNakedOrder(chain
-                                , "Call"
-                                , delta = self.parameters["delta"]
-                                , sell = self.parameters["creditStrategy"]
-                                )
+   orderBuilder, orderConstants, orderParameters = strategyTable["Call"]
 
 
 class StraddleStrategy(OptionStrategy):
-   def getOrder(self, chain):
-      return self.getStraddleOrder(chain
-                                   , netDelta = self.parameters["netDelta"]
-                                   , sell = self.parameters["creditStrategy"]
-                                   )
+   orderBuilder, orderConstants, orderParameters = strategyTable["Straddle"]
 
 
 class StrangleStrategy(OptionStrategy):
-   def getOrder(self, chain):
-      return self.getStrangleOrder(chain
-                                   , callDelta = self.parameters["callDelta"]
-                                   , putDelta = self.parameters["putDelta"]
-                                   , sell = self.parameters["creditStrategy"]
-                                   )
+   orderBuilder, orderConstants, orderParameters = strategyTable["Strangle"]
 
 
 class PutSpreadStrategy(OptionStrategy):
-   def getOrder(self, chain):
-      return self.getSpreadOrder(chain
-                                 , "Put"
-                                 , delta = self.parameters["delta"]
-                                 , wingSize = self.parameters["wingSize"]
-                                 , sell = self.parameters["creditStrategy"]
-                                 )
+   orderBuilder, orderConstants, orderParameters = strategyTable["PutSpread"]
 
 
 class CallSpreadStrategy(OptionStrategy):
-   def getOrder(self, chain):
-      return self.getSpreadOrder(chain
-                                 , "Call"
-                                 , delta = self.parameters["delta"]
-                                 , wingSize = self.parameters["wingSize"]
-                                 , sell = self.parameters["creditStrategy"]
-                                 )
+   orderBuilder, orderConstants, orderParameters = strategyTable["CallSpread"]
 
 
 class IronCondorStrategy(OptionStrategy):
-   def getOrder(self, chain):
-      return self.getIronCondorOrder(chain
-                                     , callDelta = self.parameters["callDelta"]
-                                     , putDelta = self.parameters["putDelta"]
-                                     , callWingSize = self.parameters["callWingSize"]
-                                     , putWingSize = self.parameters["putWingSize"]
-                                     , sell = self.parameters["creditStrategy"]
-                                     )
+   orderBuilder, orderConstants, orderParameters = strategyTable["IronCondor"]
 
 
 class IronFlyStrategy(OptionStrategy):
-   def getOrder(self, chain):
-      return self.getIronFlyOrder(chain
-                                  , netDelta = self.parameters["netDelta"]
-                                  , callWingSize = self.parameters["callWingSize"]
-                                  , putWingSize = self.parameters["putWingSize"]
-                                  , sell = self.parameters["creditStrategy"]
-                                  )
-      
+   orderBuilder, orderConstants, orderParameters = strategyTable["IronFly"]
+
 class ButterflyStrategy(OptionStrategy):
-   def getOrder(self, chain):
-      return self.getButterflyOrder(chain
-                                  , netDelta = self.parameters["netDelta"]
-                                  , type = self.parameters["butteflyType"]
-                                  , leftWingSize = self.parameters["butterflyLeftWingSize"]
-                                  , rightWingSize = self.parameters["butterflyRightWingSize"]
-                                  , sell = self.parameters["creditStrategy"]
-                                  )
+   orderBuilder, orderConstants, orderParameters = strategyTable["Butterfly"]
 
 class CustomStrategy(OptionStrategy):
+   orderBuilder, orderConstants, orderParameters = strategyTable["Custom"]
+
    def getOrder(self, chain):
-      return self.getCustomOrder(chain
-                                  , types = self.parameters.get("types", None)
-                                  , deltas = self.parameters.get("deltas", None)
-                                  , sides = self.parameters.get("sides", None)
-                                  , sidesDesc =self.parameters.get("sidesDesc", None)
-                                  , strategy = self.name
-                                  , sell = self.parameters["creditStrategy"]
-                                  )
+      return self.buildOrder(chain, strategy = self.name, **self.orderArgs)
 
 
 
 class TEBombShelterStrategy(OptionStrategy):
 
+   # List of expiry dates found in the chain (sorted in reverse order) and the date when it was built. 
+   # The set of expiry dates only changes once per day, so the list is rebuilt at most once per day
+   expiryCacheDate = None
+   expiryCache = None
+
+   def __init__(self, context, **kwargs):
+      super().__init__(context, **kwargs)
+      # Get the strategy parameters. They do not change after this point, so they are only looked up once
+      parameters = self.parameters
+      # Delta of the short Put (back cycle)
+      self.shortPutDelta = parameters["delta"]
+      # Max DTE of the front cycle
+      self.frontDte = parameters["frontDte"]
+      # Percentage of the premium alloated to the Bomb Shelter hedge
+      self.hedgeAllocation = parameters.get("hedgeAllocation") or 0.0
+      # Controls whether to allow mutiple entries for the same expiry date
+      self.allowMultipleEntriesPerExpiry = parameters["allowMultipleEntriesPerExpiry"]
+      # Chart update frequency (minutes) and whether to plot the details of each leg
+      self.chartUpdateFrequency = parameters.get("chartUpdateFrequency")
+      self.plotLegDetails = parameters.get("plotLegDetails", False)
+      # Keep track of the ids of the orders opened by this strategy (used to compute the PnL components on the charts)
+      self.bookOrderIds = []
+
    def run(self, chain, expiryList = None):
    
       context = self.context
+      # Get the current date (only once)
+      today = context.Time.date()
       
       if expiryList == None:
-         # List of expiry dates, sorted in reverse order
-         expiryList = sorted(set([contract.Expiry for contract in chain]), reverse = True)
-         # Log the list of expiration dates found in the chain
-         self.logger.debug("Expiration dates in the chain:")
-         for expiry in expiryList:
-            self.logger.debug(f" -> {expiry}")
+         # Rebuild the list of expiry dates on the first run of the day (or if the chain was empty the last time)
+         if today != self.expiryCacheDate or not self.expiryCache:
+            # List of expiry dates, sorted in reverse order
+            self.expiryCache = sorted({contract.Expiry for contract in chain}, reverse = True)
+            self.expiryCacheDate = today
+            # Log the list of expiration dates found in the chain
+            self.logger.debug("Expiration dates in the chain:")
+            for expiry in self.expiryCache:
+               self.logger.debug(f" -> {expiry}")
+         expiryList = self.expiryCache
+
+      # Exit if there are no expiration dates to process
+      if not expiryList:
+         return
 
       # Get the furthest expiry date (Back cycle)
       backExpiry = expiryList[0]
       
-      # Get the list of expiry dates that are within the front-cycle DTE requirement
-      frontExpiryList = sorted([expiry for expiry in expiryList 
-                                   if (expiry.date() - context.Time.date()).days <= self.parameters["frontDte"]
-                               ]
-                               , reverse = True
-                               )
+      # Get the furthest expiry date (Front cycle) that is within the front-cycle DTE requirement. 
+      # The expiry list is sorted in reverse order, so the first match is the furthest one
+      frontDte = self.frontDte
+      frontExpiry = None
+      for expiry in expiryList:
+         if (expiry.date() - today).days <= frontDte:
+            frontExpiry = expiry
+            break
 
       # Exit if we could not find any front-cycle expiration
-      if not frontExpiryList:
+      if frontExpiry == None:
          return
       
-      # Get the furthest expiry date (Front cycle)
-      frontExpiry = frontExpiryList[0]
-      
       # Convert the date to a string
-      expiryStr = frontExpiry.strftime("%Y-%m-%d")
-
-      # Proceed if we have not already opened a position on the given expiration
-      if(self.parameters["allowMultipleEntriesPerExpiry"] or expiryStr not in self.openPositions):
-         # Filter the contracts in the chain, keep only the ones expiring on the back-cycle
-         backChain = self.filterByExpiry(chain, expiry = backExpiry, computeGreeks = False)
-         # Filter the contracts in the chain, keep only the ones expiring on the front-cycle
-         frontChain = self.filterByExpiry(chain, expiry = frontExpiry, computeGreeks = False)
+      expiryStr = self.getExpiryStr(frontExpiry)
+
+      # Proceed if we have not already opened a position on the given expiration (the open positions are keyed by the expiry date unless allowMultipleEntriesPerExpiry = True)
+      if(self.allowMultipleEntriesPerExpiry or expiryStr not in self.openPositions):
+         # Filter the contracts in the chain (single pass), keep only the ones expiring on the back-cycle and on the front-cycle
+         filteredChains = self.filterByExpiries(chain, (backExpiry, frontExpiry), computeGreeks = False)
+         backChain = filteredChains[backExpiry]
+         frontChain = filteredChains[frontExpiry]
          
          # Call the getOrder method of this class
          order = self.getOrder(backChain, frontChain)
@@ -167,22 +157,20 @@ class TEBombShelterStrategy(OptionStrategy):
 
 
 
+   def openPosition(self, order, linkedOrderTag = None):
+      super().openPosition(order, linkedOrderTag = linkedOrderTag)
+      # Keep track of the order if it has been added to the book
+      if order and "orderId" in order:
+         self.bookOrderIds.append(order["orderId"])
+
    def getOrder(self, backChain, frontChain):
    
       # Theta Engine + Bomb Shelter combo: 1 short Put (back-cycle) and buy 2 long puts (front-cycle)
       sides = [-1, 2]
       strategy = "TE Bomb Shelter"
 
-      # Get the Strategy parameters
-      parameters = self.parameters
-      
-      # Set the Delta for the short Put
-      delta = parameters["delta"]
-      # Percentage of the premium alloated to the Bomb Shelter hedge
-      hedgeAllocation = parameters["hedgeAllocation"] or 0.0
-
       # Get all Puts (back cycle) with a Delta lower than the given delta
-      back_contracts = self.strategyBuilder.getPuts(backChain, toDelta = delta)
+      back_contracts = self.strategyBuilder.getPuts(backChain, toDelta = self.shortPutDelta, limit = 1)
       
       # Exit if we could not find a Put matching the specified Delta criteria
       if not back_contracts:
@@ -193,10 +181,10 @@ class TEBombShelterStrategy(OptionStrategy):
       # Get the mid-price of the short put
       midPrice = self.contractUtils.midPrice(shortPut)
       # Set the target price for the long Puts
-      targetLongPrice = midPrice * hedgeAllocation / 2
+      targetLongPrice = midPrice * self.hedgeAllocation / 2
       
       # Get all Puts (front cycle) with a price 
-      front_contracts = self.strategyBuilder.getPuts(frontChain, toPrice = targetLongPrice)
+      front_contracts = self.strategyBuilder.getPuts(frontChain, toPrice = targetLongPrice, limit = 1)
 
       # Exit if we could not find a Put matching the specified price criteria
       if not front_contracts:
@@ -214,6 +202,10 @@ class TEBombShelterStrategy(OptionStrategy):
    # Add BombShelter custom charts
    def setupCharts(self):
 
+      # Skip the setup if the charts are disabled (chartUpdateFrequency = None): updateCharts exits before using any of them
+      if self.chartUpdateFrequency == None:
+         return
+
       # Keep track of all the time series
       self.TEBSPlotCount = 0
       # Create a plot to chart the PnL components of this strategy
@@ -221,90 +213,120 @@ class TEBombShelterStrategy(OptionStrategy):
       self.TEBSPlotSummary.AddSeries(Series("Theta Engine PnL", SeriesType.Line, self.TEBSPlotCount))
       self.TEBSPlotSummary.AddSeries(Series("Hedge PnL", SeriesType.Line, self.TEBSPlotCount))
       self.TEBSPlotSummary.AddSeries(Series("Bomb Shelter PnL", SeriesType.Line, self.TEBSPlotCount))
-      # Add a plot to chrt the value of each leg
-      self.TEBSPlotDetails = Chart("TE Bomb Shelter Details")
+
+      # The details chart is only needed if we plot the details of each leg
+      if self.plotLegDetails:
+         # Labels of the series of each order that has already been added to the details chart: {<orderId>: (<Short Put label>, <Long Put label>)}
+         self.TEBSPlotLabels = {}
+         # Add a plot to chrt the value of each leg
+         self.TEBSPlotDetails = Chart("TE Bomb Shelter Details")
       
    # Update BombShelter custom charts
    def updateCharts(self):
-      # Get the context
+      # Get the context and the plotting method (only once)
       context = self.context
-      # Get the strategy parameters
-      parameters = self.parameters
+      plot = context.Plot
       
       # Get the chart update frequency
-      chartUpdateFrequency = parameters.get("chartUpdateFrequency")
-       # Only run this at the specified frequency 
-      if chartUpdateFrequency == None or context.Time.minute % chartUpdateFrequency != 0:
+      chartUpdateFrequency = self.chartUpdateFrequency
+      # Exit if the charts are disabled or if this strategy has not opened any positions yet (there is nothing to plot). 
+      # These checks do not need to access the current time
+      if chartUpdateFrequency == None or not self.bookOrderIds:
+         return
+      # Only run this at the specified frequency (aligned to the clock: this method is called multiple times per time bar, so a call counter cannot be used)
+      if context.Time.minute % chartUpdateFrequency != 0:
          return
       
       
-      # Compute the total PnL of the Short positions across the entire book (excluding cancelled orders)
-      shortPnL = sum(list(map(lambda bookPosition: 
-                                 bookPosition.get(f"{self.name}.shortPut.PnL", 0) * bookPosition["orderQuantity"] * int(not bookPosition["orderCancelled"])
-                              , context.allPositions.values()
-                              )
-                          )
-                     )
-      # Compute the total PnL of the two Long positions across the entire book (excluding cancelled orders)
-      longPnL = sum(list(map(lambda bookPosition: 
-                                 bookPosition.get(f"{self.name}.longPut.PnL", 0) * 2 * bookPosition["orderQuantity"] * int(not bookPosition["orderCancelled"])
-                              , context.allPositions.values()
-                              )
-                          )
-                     )
+      # Keys of the PnL of the Short and Long legs within each position of the book
+      shortPnLKey = f"{self.name}.shortPut.PnL"
+      longPnLKey = f"{self.name}.longPut.PnL"
+      # Compute the total PnL of the Short and Long positions opened by this strategy (excluding cancelled orders) in a single pass
+      shortPnL = 0.0
+      longPnL = 0.0
+      allPositions = context.allPositions
+      cancelledOrderIds = []
+      for orderId in self.bookOrderIds:
+         bookPosition = allPositions.get(orderId)
+         # Skip cancelled orders (they might have been removed from the book)
+         if bookPosition == None or bookPosition["orderCancelled"]:
+            cancelledOrderIds.append(orderId)
+            continue
+         orderQuantity = bookPosition["orderQuantity"]
+         shortPnL += bookPosition.get(shortPnLKey, 0) * orderQuantity
+         # The Long position has two contracts
+         longPnL += bookPosition.get(longPnLKey, 0) * 2 * orderQuantity
+      # A cancelled order stays cancelled: stop tracking it so it is not checked again on the next update
+      for orderId in cancelledOrderIds:
+         self.bookOrderIds.remove(orderId)
       # Compute the net PnL
       netPnL = shortPnL + longPnL
       
       # Plot the current value of the option contracts
-      context.Plot("TE Bomb Shelter Summary", "Theta Engine PnL", shortPnL)
-      context.Plot("TE Bomb Shelter Summary", "Hedge PnL", longPnL)
-      context.Plot("TE Bomb Shelter Summary", "Bomb Shelter PnL", netPnL)
+      plot("TE Bomb Shelter Summary", "Theta Engine PnL", shortPnL)
+      plot("TE Bomb Shelter Summary", "Hedge PnL", longPnL)
+      plot("TE Bomb Shelter Summary", "Bomb Shelter PnL", netPnL)
       
-      # Loop through all the open positions (specific to this strategy)
-      for positionKey in list(self.openPositions):
-         if positionKey in self.openPositions:
-            # Extract the open position and the order id
-            openPosition = self.openPositions[positionKey]
-            orderId = openPosition["orderId"]
-            # Retrieve the position details from the book
-            bookPosition = context.allPositions[orderId]
-
-            # Skip plotting this position if it's not yet filled or if it was filled at a stale price
-            if not openPosition["open"]["filled"] or openPosition["open"]["stalePrice"]:
-               continue
-            
-            # Get the parameter plotLegDetails (if defined). Set the default to False if not defined.
-            plotLegDetails = parameters.get("plotLegDetails", False)
-            
-            # Exit if we don't need to plot the details of each leg
-            if not plotLegDetails:
-               return
-               
-            # Get the Short and Long contracts
-            shortPut = openPosition["contracts"][0]
-            longPut = openPosition["contracts"][1]
-            
-            # Compute the current value of the contracts (the Long has two contracts)
-            shortValue = self.contractUtils.midPrice(shortPut)
-            longValue = self.contractUtils.midPrice(longPut) * 2
-            
-            # Define the stats variable names
-            shortVarName = f"TEBS_shortPut_{orderId}"
-            longVarName = f"TEBS_longPut_{orderId}"
-            
-            # Check if this is the first time that we are potting this data
-            if not hasattr(context.stats, shortVarName):
-               # Increase the plot counter. Each position will be plotted on a separate subplot (use TEBSPlotCount as the plot index level)
-               self.TEBSPlotCount += 1
-               # Add the time series
-               self.TEBSPlotDetails.AddSeries(Series(f"{orderId} - Short Put ({shortPut.Strike})", SeriesType.Line, self.TEBSPlotCount))
-               self.TEBSPlotDetails.AddSeries(Series(f"{orderId} - Long Put Hedge ({longPut.Strike})", SeriesType.Line, self.TEBSPlotCount))
-               
-            # Set/Update the stats variable
-            setattr(context.stats, shortVarName, shortValue)
-            setattr(context.stats, longVarName, longValue)
+      # Exit if we don't need to plot the details of each leg
+      if not self.plotLegDetails:
+         return
+
+      # Get the method used to compute the value of each contract
+      midPrice = self.contractUtils.midPrice
+      # Loop through all the open positions (specific to this strategy). The positions are not modified inside the loop, so there is no need to iterate over a copy
+      for openPosition in self.openPositions.values():
+         # Get the order id
+         orderId = openPosition["orderId"]
+
+         # Skip plotting this position if it's not yet filled or if it was filled at a stale price
+         if not openPosition["open"]["filled"] or openPosition["open"]["stalePrice"]:
+            continue
             
-            # Plot the current value of the option contracts
-            context.Plot("TE Bomb Shelter Details", f"{orderId} - Short Put (Strike: {int(shortPut.Strike)})", shortValue)
-            context.Plot("TE Bomb Shelter Details", f"{orderId} - Long Put Hedge (Strike: {int(longPut.Strike)})", longValue)
+         # Get the Short and Long contracts
+         shortPut = openPosition["contracts"][0]
+         longPut = openPosition["contracts"][1]
+         
+         # Compute the current value of the contracts (the Long has two contracts)
+         shortValue = midPrice(shortPut)
+         longValue = midPrice(longPut) * 2
+         
+         # Check if this is the first time that we are potting this data
+         plotLabels = self.TEBSPlotLabels.get(orderId)
+         if plotLabels == None:
+            # Increase the plot counter. Each position will be plotted on a separate subplot (use TEBSPlotCount as the plot index level)
+            self.TEBSPlotCount += 1
+            # Add the time series
+            self.TEBSPlotDetails.AddSeries(Series(f"{orderId} - Short Put ({shortPut.Strike})", SeriesType.Line, self.TEBSPlotCount))
+            self.TEBSPlotDetails.AddSeries(Series(f"{orderId} - Long Put Hedge ({longPut.Strike})", SeriesType.Line, self.TEBSPlotCount))
+            # Build the labels used to plot the value of the contracts (only once per order)
+            plotLabels = (f"{orderId} - Short Put (Strike: {int(shortPut.Strike)})", f"{orderId} - Long Put Hedge (Strike: {int(longPut.Strike)})")
+            self.TEBSPlotLabels[orderId] = plotLabels
             
+         # Plot the current value of the option contracts
+         plot("TE Bomb Shelter Details", plotLabels[0], shortValue)
+         plot("TE Bomb Shelter Details", plotLabels[1], longValue)
+
+
+
+
+# Strategy class of each strategy type (same keys as strategyTable, plus the strategies with a custom getOrder method)
+strategyClasses = {"Put": PutStrategy
+                   , "Call": CallStrategy
+                   , "Straddle": StraddleStrategy
+                   , "Strangle": StrangleStrategy
+                   , "PutSpread": PutSpreadStrategy
+                   , "CallSpread": CallSpreadStrategy
+                   , "IronCondor": IronCondorStrategy
+                   , "IronFly": IronFlyStrategy
+                   , "Butterfly": ButterflyStrategy
+                   , "Custom": CustomStrategy
+                   , "TEBombShelter": TEBombShelterStrategy
+                   }
+
+# Create a strategy by its type (i.e. createStrategy(self, "IronCondor", name = "IC", putDelta = 10, callDelta = 10, putWingSize = 10, callWingSize = 10))
+# The order builder and its arguments are resolved only once, when the strategy is created
+def createStrategy(context, strategyType, **kwargs):
+   strategyClass = strategyClasses.get(strategyType)
+   if strategyClass == None:
+      raise ValueError(f"Input parameter strategyType = {strategyType} is invalid. Valid values: {'|'.join(strategyClasses)}")
+   return strategyClass(context, **kwargs)
@@ -18,12 +18,24 @@ from AlgorithmImports import *
 #                                                                                      #
 ########################################################################################
 
+import numpy as np
 from Logger import *
 from ContractUtils import *
 from BSMLibrary import *
+from ChainArrays import *
+from NumbaKernels import *
 
 class StrategyBuilder:
 
+   # Option right corresponding to each option type (the most common spellings are listed explicitly, so the type does not need to be normalized with lower())
+   optionRightByType = {"put": OptionRight.Put
+                        , "Put": OptionRight.Put
+                        , "PUT": OptionRight.Put
+                        , "call": OptionRight.Call
+                        , "Call": OptionRight.Call
+                        , "CALL": OptionRight.Call
+                        }
+
    # \param[in] context is a reference to the QCAlgorithm instance. The following attributes are used from the context:
    #    - slippage: (Optional) controls how the mid-price of an order is adjusted to include slippage.
    #    - targetPremium: (Optional) used to determine how many contracts to buy/sell.  
@@ -39,50 +51,107 @@ class StrategyBuilder:
       self.logger = Logger(context, className = type(self).__name__, logLevel = context.logLevel)
       # Initialize the contract utils
       self.contractUtils = ContractUtils(context)
-
+      # Struct-of-arrays snapshot of the most recent chain processed
+      self.chainArrays = None
+      # Strike of the contract found by the last Delta search for each (<Call/Put>, <Delta>) pair, used as the starting point of the next search
+      self.deltaSeedStrikes = {}
+
+   # Returns the struct-of-arrays snapshot of the given contracts. The snapshot is reused as long as the same chain is processed within the same time bar
+   # (by any strategy: the snapshots are shared through the context)
+   def getChainArrays(self, contracts):
+      # Get the current time
+      currentTime = self.context.Time
+      # Check if we already have the snapshot for this chain
+      if self.chainArrays == None or not self.chainArrays.isSnapshotOf(contracts, time = currentTime):
+         # Check if the snapshot has already been created by another strategy, otherwise create a new one
+         sharedCache = ChainArrays.getSharedCache(self.context)
+         cacheKey = ("ChainArrays", id(contracts))
+         chainArrays = sharedCache.get(cacheKey)
+         if chainArrays == None or not chainArrays.isSnapshotOf(contracts, time = currentTime):
+            chainArrays = ChainArrays(contracts, time = currentTime)
+            sharedCache[cacheKey] = chainArrays
+         self.chainArrays = chainArrays
+      return self.chainArrays
+
+   # Make sure all the given contracts have the Greeks for the current time bar (computed in a single batch and stored on each contract). 
+   # The Deltas are also stored into the struct-of-arrays snapshot of the contracts, so they can be reused by the BSM Delta search on the same contracts (see searchDeltaIdx)
+   def setChainGreeks(self, contracts):
+      # Make sure the contracts can be accessed by index
+      if not isinstance(contracts, list):
+         contracts = list(contracts)
+      # Exit if there are no contracts
+      if not contracts:
+         return
+      # Compute the Greeks of every contract that does not have them for the current time bar (the BSM class checks each contract)
+      self.bsm.setGreeks(contracts)
+      # Copy the Deltas into the snapshot
+      self.getChainArrays(contracts).getDeltas(self.bsm, np.arange(len(contracts)))
+
+   # Returns the option right (OptionRight.Put/OptionRight.Call) of the specified option type (Put/Call), or None if the type is not valid
+   def getOptionRight(self, type):
+      right = StrategyBuilder.optionRightByType.get(type)
+      if right == None and type != None:
+         right = StrategyBuilder.optionRightByType.get(type.lower())
+      return right
 
    # Returns True/False based on whether the option contract is of the specified type (Call/Put)
    def optionTypeFilter(self, contract, type = None):
-      if type == None:
-         return True
-
-      type = type.lower()
-      if type == "put":
-         return contract.Right == OptionRight.Put 
-      elif type == "call":
-         return contract.Right == OptionRight.Call
-      else:
+      right = self.getOptionRight(type)
+      if right == None:
          return True
+      return contract.Right == right
 
 
    # Return the ATM contracts (Put/Call or both)
    def getATM(self, contracts, type = None):
 
-      # Initialize result
-      atm_contracts = []
-
-      # Sort the contracts based on how close they are to the current price of the underlying. 
-      # Filter them by the selected contract type (Put/Call or both)
-      sorted_contracts = sorted([contract 
-                                    for contract in contracts 
-                                       if self.optionTypeFilter(contract, type)
-                                 ]
-                                , key = lambda x: abs(x.Strike - self.contractUtils.getUnderlyingLastPrice(x))
-                                , reverse = False
-                                )
-
-      # Check if any contracts were returned after the filtering
-      if len(sorted_contracts) > 0:
-         if type == None or type.lower() == "both":
+      # Make sure the contracts can be accessed by index
+      if not isinstance(contracts, list):
+         contracts = list(contracts)
+      # Exit if there are no contracts
+      if not contracts:
+         return []
+
+      # Normalize the contract type
+      type = type.lower() if type != None else None
+      # Get the struct-of-arrays snapshot of the contracts
+      chainArrays = self.getChainArrays(contracts)
+      # Check if we have already processed this request for the current snapshot
+      cacheKey = ("ATM", type)
+      atmIdx = chainArrays.cache.get(cacheKey)
+      if atmIdx is None:
+         # Filter the contracts by the selected contract type (Put/Call or both)
+         if type == "put":
+            candidateIdx = chainArrays.putIdx
+         elif type == "call":
+            candidateIdx = chainArrays.callIdx
+         else:
+            candidateIdx = np.arange(len(contracts))
+         # Get the price of the underlying (all the contracts in the chain have the same underlying)
+         underlyingPrice = self.contractUtils.getUnderlyingLastPrice(contracts[0])
+         if type == None or type == "both":
             # Select the first two contracts (one Put and one Call)
-            Ncontracts = min(len(sorted_contracts), 2)
+            Ncontracts = 2
          else:
             # Select the first contract (either Put or Call, based on the type specified)
             Ncontracts = 1
-         # Extract the selected contracts
-         atm_contracts = sorted_contracts[0:Ncontracts]
+         # Distance of each contract from the current price of the underlying
+         distances = np.abs(chainArrays.strikes[candidateIdx] - underlyingPrice)
+         # No need to sort all the contracts: find the distance of the Ncontracts-th closest contract with a partial sort, and only keep the contracts within this distance
+         if len(candidateIdx) > Ncontracts:
+            maxDistance = np.partition(distances, Ncontracts-1)[Ncontracts-1]
+            closestIdx = distances <= maxDistance
+            candidateIdx = candidateIdx[closestIdx]
+            distances = distances[closestIdx]
+         # Sort the remaining contracts based on how close they are to the current price of the underlying (stable sort on the chain order: contracts at the same distance keep the chain order)
+         chainOrder = np.argsort(candidateIdx, kind = "stable")
+         candidateIdx = candidateIdx[chainOrder]
+         sortedIdx = candidateIdx[np.argsort(distances[chainOrder], kind = "stable")]
+         # Extract the selected contracts and store them in the cache
+         atmIdx = sortedIdx[0:Ncontracts]
+         chainArrays.cache[cacheKey] = atmIdx
       # Return result
-      return atm_contracts
+      return chainArrays.getContracts(atmIdx)
 
 
    def getATMStrike(self, contracts):
@@ -106,42 +175,52 @@ class StrategyBuilder:
       # Skip processing if the option type or Delta has not been specified
       if delta == None or not contracts:
          return
-      
+
+      # Check if this request has already been processed at the current time (by this or another strategy) for the same list of contracts
+      sharedCache = ChainArrays.getSharedCache(self.context)
+      cacheKey = ("DeltaContract", id(contracts), delta)
+      cachedEntry = sharedCache.get(cacheKey)
+      if cachedEntry != None and cachedEntry[0] is contracts:
+         return cachedEntry[1]
+      deltaContract = self.searchDeltaContract(contracts, delta)
+      sharedCache[cacheKey] = (contracts, deltaContract)
+      return deltaContract
+
+   # Run the search for getDeltaContract (no caching)
+   def searchDeltaContract(self, contracts, delta):
+      # Bind the method used at each step of the search (avoid resolving the attributes at each iteration)
+      setGreeks = self.bsm.setGreeks
+
       leftIdx = 0
       rightIdx = len(contracts)-1
       
       # Compute the Greeks for the contracts at the extremes
-      self.bsm.setGreeks([contracts[leftIdx], contracts[rightIdx]])
+      setGreeks([contracts[leftIdx], contracts[rightIdx]])
       
       # #######################################################
       # Check if the requested Delta is outside of the range
       # #######################################################
+      # Furthest OTM/ITM contracts: the highest/lowest strike for Calls, the lowest/highest strike for Puts
       if contracts[rightIdx].Right == OptionRight.Call:
-         # Check if the furthest OTM Call has a Delta higher than the requested Delta
-         if abs(contracts[rightIdx].BSMGreeks.Delta) > delta/100.0:
-            # The requested delta is outside the boundary, return the strike of the furthest OTM Call
-            return contracts[rightIdx]
-         # Check if the furthest ITM Call has a Delta lower than the requested Delta   
-         elif abs(contracts[leftIdx].BSMGreeks.Delta) < delta/100.0:
-            # The requested delta is outside the boundary, return the strike of the furthest ITM Call
-            return contracts[leftIdx]
+         otmContract, itmContract = contracts[rightIdx], contracts[leftIdx]
       else:
-         # Check if the furthest OTM Put has a Delta higher than the requested Delta
-         if abs(contracts[leftIdx].BSMGreeks.Delta) > delta/100.0:
-            # The requested delta is outside the boundary, return the strike of the furthest OTM Put
-            return contracts[leftIdx]
-         # Check if the furthest ITM Put has a Delta lower than the requested Delta   
-         elif abs(contracts[rightIdx].BSMGreeks.Delta) < delta/100.0:
-            # The requested delta is outside the boundary, return the strike of the furthest ITM Put
-            return contracts[rightIdx]
+         otmContract, itmContract = contracts[leftIdx], contracts[rightIdx]
+      # Check if the furthest OTM contract has a Delta higher than the requested Delta
+      if abs(otmContract.BSMGreeks.Delta) > delta/100.0:
+         # The requested delta is outside the boundary, return the furthest OTM contract
+         return otmContract
+      # Check if the furthest ITM contract has a Delta lower than the requested Delta   
+      elif abs(itmContract.BSMGreeks.Delta) < delta/100.0:
+         # The requested delta is outside the boundary, return the furthest ITM contract
+         return itmContract
       
       # The requested Delta is inside the range, use the Bisection method to find the contract with the closest Delta
       while (rightIdx-leftIdx) > 1:
          # Get the middle point
          middleIdx = round((leftIdx + rightIdx)/2.0)
          middleContract = contracts[middleIdx]
-         # Compute the greeks for the contract in the middle
-         self.bsm.setGreeks(middleContract)
+         # Compute the greeks for the contract in the middle (use the batch method, same as for the contracts at the extremes)
+         setGreeks([middleContract])
          contractDelta = contracts[middleIdx].BSMGreeks.Delta
          # Determine which side we need to continue the search
          if(abs(contractDelta) > delta/100.0):
@@ -159,16 +238,221 @@ class StrategyBuilder:
                # The requested Put Delta is on the right side
                leftIdx = middleIdx
       
-      # At this point where should only be two contracts remaining: choose the contract with the closest Delta
-      deltaContract = sorted([contracts[leftIdx], contracts[rightIdx]]
-                             , key = lambda x: abs(abs(x.BSMGreeks.Delta) - delta/100.0)
-                             , reverse = False
-                             )[0]
+      # At this point where should only be two contracts remaining: choose the contract with the closest Delta (the left one in case of a tie)
+      deltaContract = min(contracts[leftIdx], contracts[rightIdx], key = lambda x: abs(abs(x.BSMGreeks.Delta) - delta/100.0))
       
       return deltaContract
 
 
 
+   # Same as getDeltaContract, but working on the struct-of-arrays snapshot of the chain: 
+   #  - idx: indices of the contracts (all of the same type, sorted by ascending strike)
+   # Returns a tuple (deltaIdx, deltaValue): the index of the contract with the closest Delta and the Delta of that contract (None, None if the Delta has not been specified). 
+   # The Deltas are computed on demand (only for the contracts visited by the search) and cached in the snapshot
+   def getDeltaIdx(self, chainArrays, idx, delta = None):
+      # Skip processing if the Delta has not been specified
+      if delta == None or len(idx) == 0:
+         return None, None
+
+      # Check if we have already processed this request for the current snapshot (i.e. multiple spreads built on the same contracts)
+      cacheKey = ("DeltaIdx", delta, idx.tobytes())
+      result = chainArrays.cache.get(cacheKey)
+      if result == None:
+         result = self.searchDeltaIdx(chainArrays, idx, delta)
+         chainArrays.cache[cacheKey] = result
+      return result
+
+   # Returns the position (within the range) of the contract with the closest Delta, given the Deltas of all the contracts in the range (same result as the search, see searchDeltaIdx)
+   def getClosestDeltaPos(self, rangeDeltas, isCall, delta):
+      rangeDeltas = np.abs(rangeDeltas)
+      targetDelta = delta/100.0
+      # Furthest OTM/ITM contracts (Calls: the Delta decreases with the strike, Puts: the Delta increases with the strike)
+      otmPos, itmPos = (len(rangeDeltas)-1, 0) if isCall else (0, len(rangeDeltas)-1)
+      # Check if the requested Delta is outside of the range (same checks as the search)
+      if rangeDeltas[otmPos] > targetDelta:
+         return otmPos
+      elif rangeDeltas[itmPos] < targetDelta:
+         return itmPos
+      # Pick the contract with the closest Delta (the one with the lowest strike in case of a tie, same as the search)
+      return int(np.argmin(np.abs(rangeDeltas - targetDelta)))
+
+   # Run the search for getDeltaIdx (no caching). 
+   # The search always uses the compiled kernel, and only falls back to the BSM class if the kernel fails: the two use different IV solvers, so the contract selected for a given Delta 
+   # does not depend on which Deltas happen to be available already (i.e. whether the Greeks of the chain have been computed by another strategy, see setChainGreeks)
+   def searchDeltaIdx(self, chainArrays, idx, delta):
+      isCall = bool(chainArrays.isCall[idx[0]])
+      # Check if the kernel has already computed the Deltas of all the contracts (i.e. From/To Delta searches on the same range): no need to search, just pick the contract with the closest Delta
+      if chainArrays.kernelDeltas is not None:
+         rangeDeltas = chainArrays.kernelDeltas[idx]
+         if not np.isnan(rangeDeltas).any():
+            deltaIdx = idx[self.getClosestDeltaPos(rangeDeltas, isCall, delta)]
+            return deltaIdx, chainArrays.kernelDeltas[deltaIdx]
+
+      # Run the search with the compiled kernel
+      deltaIdx = self.getDeltaIdxJit(chainArrays, idx, delta)
+      if deltaIdx != None:
+         return deltaIdx, chainArrays.kernelDeltas[deltaIdx]
+
+      # Fallback: the IV of some of the contracts could not be computed by the kernel, run the search using the BSM class
+      deltaIdx = self.searchDeltaIdxBSM(chainArrays, idx, delta)
+      return deltaIdx, chainArrays.deltas[deltaIdx]
+
+   # Run the search for getDeltaIdx using the BSM class (the Greeks of the contracts visited by the search are stored on each contract)
+   def searchDeltaIdxBSM(self, chainArrays, idx, delta):
+      # Check if the Deltas of all the contracts are already available (i.e. the Greeks of the whole chain have been computed up front, see setChainGreeks): 
+      # no need to search, just pick the contract with the closest Delta
+      if chainArrays.deltas is not None:
+         rangeDeltas = chainArrays.deltas[idx]
+         if not np.isnan(rangeDeltas).any():
+            return idx[self.getClosestDeltaPos(rangeDeltas, chainArrays.isCall[idx[0]], delta)]
+
+      # Bind the method used at each step of the search (avoid resolving the attributes at each iteration)
+      getDeltas = chainArrays.getDeltas
+      bsm = self.bsm
+      # Target Delta
+      targetDelta = delta/100.0
+      leftIdx = 0
+      rightIdx = len(idx)-1
+      isCall = chainArrays.isCall[idx[0]]
+
+      # Compute the Greeks for the contracts at the extremes
+      deltas = getDeltas(bsm, idx[[leftIdx, rightIdx]])
+
+      # Check if the requested Delta is outside of the range (furthest OTM/ITM contracts: the highest/lowest strike for Calls, the lowest/highest strike for Puts)
+      otmIdx, itmIdx = (idx[rightIdx], idx[leftIdx]) if isCall else (idx[leftIdx], idx[rightIdx])
+      # Check if the furthest OTM contract has a Delta higher than the requested Delta
+      if abs(deltas[otmIdx]) > targetDelta:
+         return otmIdx
+      # Check if the furthest ITM contract has a Delta lower than the requested Delta   
+      elif abs(deltas[itmIdx]) < targetDelta:
+         return itmIdx
+
+      # The requested Delta is inside the range. The contract with the requested Delta is usually close to the one found by the previous search: 
+      # start from there and expand the search interval (1, 2, 4, ... contracts) until it brackets the requested Delta (hunt phase)
+      seedKey = (bool(isCall), delta)
+      seedStrike = self.deltaSeedStrikes.get(seedKey)
+      if seedStrike != None and (rightIdx-leftIdx) > 1:
+         # Position of the seed strike (within the interior of the range)
+         seedIdx = min(max(int(np.searchsorted(chainArrays.strikes[idx], seedStrike)), leftIdx + 1), rightIdx - 1)
+         deltas = getDeltas(bsm, idx[seedIdx:seedIdx+1])
+         step = 1
+         if (abs(deltas[idx[seedIdx]]) > targetDelta) == isCall:
+            # The requested Delta is on the right side of the seed
+            leftIdx = seedIdx
+            while seedIdx + step < rightIdx:
+               probeIdx = seedIdx + step
+               deltas = getDeltas(bsm, idx[probeIdx:probeIdx+1])
+               if (abs(deltas[idx[probeIdx]]) > targetDelta) != isCall:
+                  rightIdx = probeIdx
+                  break
+               leftIdx = probeIdx
+               step *= 2
+         else:
+            # The requested Delta is on the left side of the seed
+            rightIdx = seedIdx
+            while seedIdx - step > leftIdx:
+               probeIdx = seedIdx - step
+               deltas = getDeltas(bsm, idx[probeIdx:probeIdx+1])
+               if (abs(deltas[idx[probeIdx]]) > targetDelta) == isCall:
+                  leftIdx = probeIdx
+                  break
+               rightIdx = probeIdx
+               step *= 2
+
+      # Use the Bisection method to find the contract with the closest Delta within the bracketing interval
+      while (rightIdx-leftIdx) > 1:
+         # Get the middle point
+         middleIdx = round((leftIdx + rightIdx)/2.0)
+         # Compute the greeks for the contract in the middle
+         deltas = getDeltas(bsm, idx[middleIdx:middleIdx+1])
+         # Determine which side we need to continue the search (Calls: the Delta decreases with the strike, Puts: the Delta increases with the strike)
+         if (abs(deltas[idx[middleIdx]]) > targetDelta) == isCall:
+            leftIdx = middleIdx
+         else:
+            rightIdx = middleIdx
+
+      # At this point where should only be two contracts remaining: choose the contract with the closest Delta (the left one in case of a tie)
+      deltas = chainArrays.deltas
+      if abs(abs(deltas[idx[rightIdx]]) - targetDelta) < abs(abs(deltas[idx[leftIdx]]) - targetDelta):
+         deltaIdx = idx[rightIdx]
+      else:
+         deltaIdx = idx[leftIdx]
+      # Use this contract as the starting point of the next search
+      self.deltaSeedStrikes[seedKey] = chainArrays.strikes[deltaIdx]
+      return deltaIdx
+
+   # Compiled version of the Delta search (see deltaIdxKernel): the IV and the Delta of the contracts visited by the search are computed inside the kernel and cached in the snapshot (kernelDeltas).
+   # The kernel does not set the Greeks on the contracts. Returns None if the IV of any of the contracts visited by the search could not be computed
+   def getDeltaIdxJit(self, chainArrays, idx, delta):
+      contracts = chainArrays.contracts
+      isCall = bool(chainArrays.isCall[idx[0]])
+      # Inputs of the kernel (parallel to idx). They are the same for all the searches on the same contracts (i.e. the From/To Delta searches in getContracts), so they are only collected once
+      inputsKey = ("DeltaKernelInputs", idx.tobytes())
+      kernelInputs = chainArrays.cache.get(inputsKey)
+      if kernelInputs == None:
+         strikes = chainArrays.strikes[idx]
+         midPrices = chainArrays.getMidPrices(self.contractUtils, idx)[idx]
+         taus = chainArrays.getTaus(self.bsm, idx)[idx]
+         # Start the IV search at the latest value computed by the kernel (if available). The kernel updates this array with the IVs it computes, so following searches can reuse them
+         ivs = np.array([getattr(contracts[n], "DeltaKernelIV", 0.1) for n in idx], dtype = np.float64)
+         # Get the current price of the underlying
+         spotPrice = float(self.contractUtils.getUnderlyingLastPrice(contracts[idx[0]]))
+         kernelInputs = (strikes, midPrices, taus, ivs, spotPrice)
+         chainArrays.cache[inputsKey] = kernelInputs
+      strikes, midPrices, taus, ivs, spotPrice = kernelInputs
+      # Get the Deltas already computed by a previous search
+      if chainArrays.kernelDeltas is None:
+         chainArrays.kernelDeltas = np.full(len(contracts), np.nan, dtype = np.float64)
+      deltas = chainArrays.kernelDeltas[idx]
+      # Get the risk free rate
+      self.bsm.setRiskFreeRate()
+
+      # Position of the contract found by the previous search (-1 -> not available)
+      seedKey = (isCall, delta)
+      seedStrike = self.deltaSeedStrikes.get(seedKey)
+      seedIdx = -1 if seedStrike == None else int(np.searchsorted(strikes, seedStrike))
+
+      # Run the search
+      deltaPos = deltaIdxKernel(spotPrice, strikes, midPrices, taus, isCall, float(self.bsm.riskFreeRate), delta/100.0, ivs, deltas, seedIdx)
+
+      # Store the Deltas computed by the kernel into the snapshot and the IVs into the contracts (starting point of the kernel IV search at the next time bar)
+      computed = np.flatnonzero(np.isnan(chainArrays.kernelDeltas[idx]) & ~np.isnan(deltas))
+      chainArrays.kernelDeltas[idx[computed]] = deltas[computed]
+      for n in computed:
+         contracts[idx[n]].DeltaKernelIV = ivs[n]
+
+      # Check if the search failed
+      if deltaPos < 0:
+         return None
+
+      deltaIdx = idx[deltaPos]
+      # Use this contract as the starting point of the next search
+      self.deltaSeedStrikes[seedKey] = chainArrays.strikes[deltaIdx]
+      return deltaIdx
+
+   # Same as getFromDeltaStrike (isFrom = True) and getToDeltaStrike (isFrom = False), but working on the struct-of-arrays snapshot of the chain (see getDeltaIdx)
+   def getDeltaBoundaryStrike(self, chainArrays, idx, delta = None, isFrom = True, default = None):
+      # Get the contract with the closest Delta
+      deltaIdx, contractDelta = self.getDeltaIdx(chainArrays, idx, delta = delta)
+      # Check if we found the contract
+      if deltaIdx == None:
+         return default
+      strike = chainArrays.strikes[deltaIdx]
+      contractDelta = abs(contractDelta)
+      isCall = chainArrays.isCall[deltaIdx]
+      if isFrom:
+         # Check if the contract is in the required range
+         if contractDelta >= delta/100.0:
+            return strike
+         # Outside of the range: add (Put) or subtract (Call) a small offset so we can filter for contracts above/below this strike
+         return strike + (-0.01 if isCall else 0.01)
+      else:
+         # Check if the contract is in the required range
+         if contractDelta <= delta/100.0:
+            return strike
+         # Outside of the range: add (Call) or subtract (Put) a small offset so we can filter for contracts above/below this strike
+         return strike + (0.01 if isCall else -0.01)
+
    def getDeltaStrike(self, contracts, delta = None):
       deltaStrike = None
       # Get the contract with the closest Delta
@@ -226,75 +510,86 @@ class StrategyBuilder:
       return self.getToDeltaStrike(contracts, delta = delta, default = 0)
 
 
-   def getContracts(self, contracts, type = None, fromDelta = None, toDelta = None, fromStrike = None, toStrike = None, fromPrice = None, toPrice = None, reverse = False):
+   # \param[in] limit: (Optional) maximum number of contracts returned (i.e. limit = 1 when only the first contract is needed)
+   def getContracts(self, contracts, type = None, fromDelta = None, toDelta = None, fromStrike = None, toStrike = None, fromPrice = None, toPrice = None, reverse = False, limit = None):
+      # Make sure the contracts can be accessed by index
+      if not isinstance(contracts, list):
+         contracts = list(contracts)
+      # Get the indices of the selected contracts
+      resultIdx = self.getContractsIdx(contracts
+                                       , type = type
+                                       , fromDelta = fromDelta
+                                       , toDelta = toDelta
+                                       , fromStrike = fromStrike
+                                       , toStrike = toStrike
+                                       , fromPrice = fromPrice
+                                       , toPrice = toPrice
+                                       , reverse = reverse
+                                       , limit = limit
+                                       )
+      # Only get the contracts that are needed
+      return self.chainArrays.getContracts(resultIdx)
+
+   # Same as getContracts, but returns the indices of the selected contracts within the struct-of-arrays snapshot of the chain (see getChainArrays), 
+   # so the caller can work on the arrays of the snapshot and only retrieve the contract objects that are actually needed
+   def getContractsIdx(self, contracts, type = None, fromDelta = None, toDelta = None, fromStrike = None, toStrike = None, fromPrice = None, toPrice = None, reverse = False, limit = None):
       # Make sure all constraints are set
       fromStrike = fromStrike or 0
       fromPrice = fromPrice or 0
       toStrike = toStrike or float('inf')
       toPrice = toPrice or float('inf')
 
-      # Get the Put contracts, sorted by ascending strike. Apply the Strike/Price constraints
-      puts = []
-      if type == None or type.lower() == "put":
-         puts = sorted([contract 
-                         for contract in contracts 
-                            if self.optionTypeFilter(contract, "Put")
-                            # Strike constraint
-                            and (fromStrike <= contract.Strike <= toStrike)
-                            # Option price constraint (based on the mid-price)
-                            and (fromPrice <= self.contractUtils.midPrice(contract) <= toPrice)
-                       ]
-                       , key = lambda x: x.Strike
-                       , reverse = False
-                       )
-                    
-      # Get the Call contracts, sorted by ascending strike. Apply the Strike/Price constraints
-      calls = []
-      if type == None or type.lower() == "call":
-         calls = sorted([contract 
-                          for contract in contracts 
-                             if self.optionTypeFilter(contract, "Call")
-                             # Strike constraint
-                             and (fromStrike <= contract.Strike <= toStrike)
-                             # Option price constraint (based on the mid-price)
-                             and (fromPrice <= self.contractUtils.midPrice(contract) <= toPrice)
-                        ]
-                        , key = lambda x: x.Strike
-                        , reverse = False
-                        )
-
-
-      deltaFilteredPuts = puts
-      deltaFilteredCalls = calls
+      # Make sure the contracts can be accessed by index
+      if not isinstance(contracts, list):
+         contracts = list(contracts)
+      # Get the struct-of-arrays snapshot of the contracts (Put/Call contracts are already sorted by ascending strike)
+      chainArrays = self.getChainArrays(contracts)
+      strikes = chainArrays.strikes
+      # Check if we need to filter by price
+      priceFilter = fromPrice > 0 or toPrice < float('inf')
+
+      # Get the indices of the Put and Call contracts, sorted by ascending strike. Apply the Strike/Price constraints
+      right = self.getOptionRight(type)
+      putIdx = np.empty(0, dtype = np.int64)
+      callIdx = np.empty(0, dtype = np.int64)
+      if type == None or right == OptionRight.Put:
+         putIdx = chainArrays.getStrikeRangeIdx(False, fromStrike, toStrike)
+      if type == None or right == OptionRight.Call:
+         callIdx = chainArrays.getStrikeRangeIdx(True, fromStrike, toStrike)
+      if priceFilter:
+         # Option price constraint (based on the mid-price). Only get the prices of the contracts within the Strike range, 
+         # and evaluate the constraint for the Puts and Calls in a single pass (the first nPuts entries are the Puts)
+         nPuts = len(putIdx)
+         rangeIdx = np.concatenate((putIdx, callIdx))
+         rangePrices = chainArrays.getMidPrices(self.contractUtils, rangeIdx)[rangeIdx]
+         inPriceRange = (fromPrice <= rangePrices) & (rangePrices <= toPrice)
+         putIdx = putIdx[inPriceRange[:nPuts]]
+         callIdx = callIdx[inPriceRange[nPuts:]]
+
       # Check if we need to filter by Delta
       if (fromDelta or toDelta):
-         # Find the strike range for the Puts based on the From/To Delta
-         putFromDeltaStrike = self.getPutFromDeltaStrike(puts, delta = fromDelta)
-         putToDeltaStrike = self.getPutToDeltaStrike(puts, delta = toDelta)
-         # Filter the Puts based on the delta-strike range
-         deltaFilteredPuts = [contract for contract in puts
-                                 if putFromDeltaStrike <= contract.Strike <= putToDeltaStrike
-                              ]
+         # Find the strike range for the Puts based on the From/To Delta (the Delta is computed on demand, only for the contracts visited by the bisection)
+         putFromDeltaStrike = self.getDeltaBoundaryStrike(chainArrays, putIdx, delta = fromDelta, isFrom = True, default = 0.0)
+         putToDeltaStrike = self.getDeltaBoundaryStrike(chainArrays, putIdx, delta = toDelta, isFrom = False, default = float('Inf'))
+         # Filter the Puts based on the delta-strike range (the Puts are sorted by ascending strike: slice the range with a binary search)
+         putStrikes = strikes[putIdx]
+         putIdx = putIdx[np.searchsorted(putStrikes, putFromDeltaStrike, side = "left"):np.searchsorted(putStrikes, putToDeltaStrike, side = "right")]
 
          # Find the strike range for the Calls based on the From/To Delta
-         callFromDeltaStrike = self.getCallFromDeltaStrike(calls, delta = fromDelta)
-         callToDeltaStrike = self.getCallToDeltaStrike(calls, delta = toDelta)
-         # Filter the Puts based on the delta-strike range. For the calls, the Delta decreases with increasing strike, so the order of the filter is inverted
-         deltaFilteredCalls = [contract for contract in calls
-                                 if callToDeltaStrike <= contract.Strike <= callFromDeltaStrike
-                               ]
-         
-
-      # Combine the lists and Sort the contracts by their strike in the specified order.
-      result = sorted(deltaFilteredPuts + deltaFilteredCalls
-                      , key = lambda x: x.Strike
-                      , reverse = reverse
-                      )
+         callFromDeltaStrike = self.getDeltaBoundaryStrike(chainArrays, callIdx, delta = fromDelta, isFrom = True, default = float('Inf'))
+         callToDeltaStrike = self.getDeltaBoundaryStrike(chainArrays, callIdx, delta = toDelta, isFrom = False, default = 0)
+         # Filter the Calls based on the delta-strike range. For the calls, the Delta decreases with increasing strike, so the order of the filter is inverted
+         callStrikes = strikes[callIdx]
+         callIdx = callIdx[np.searchsorted(callStrikes, callToDeltaStrike, side = "left"):np.searchsorted(callStrikes, callFromDeltaStrike, side = "right")]
+
+      # Combine the Puts and Calls and Sort the contracts by their strike in the specified order (same as sorted(puts + calls, reverse = reverse)). 
+      # Both lists are already sorted by strike, so they only need to be merged, and the merge stops as soon as we have the requested number of contracts
+      resultIdx = mergeIdxKernel(putIdx, callIdx, strikes, bool(reverse), -1 if limit == None else limit)
       # Return result
-      return result   
+      return resultIdx
 
 
-   def getPuts(self, contracts, fromDelta = None, toDelta = None, fromStrike = None, toStrike = None, fromPrice = None, toPrice = None):
+   def getPuts(self, contracts, fromDelta = None, toDelta = None, fromStrike = None, toStrike = None, fromPrice = None, toPrice = None, limit = None):
 
       # Sort the Put contracts by their strike in reverse order. Filter them by the specified criteria (Delta/Strike/Price constrains)
       return self.getContracts(contracts
@@ -306,10 +601,11 @@ class StrategyBuilder:
                                , fromPrice = fromPrice
                                , toPrice = toPrice
                                , reverse = True
+                               , limit = limit
                                )
 
 
-   def getCalls(self, contracts, fromDelta = None, toDelta = None, fromStrike = None, toStrike = None, fromPrice = None, toPrice = None):
+   def getCalls(self, contracts, fromDelta = None, toDelta = None, fromStrike = None, toStrike = None, fromPrice = None, toPrice = None, limit = None):
 
       # Sort the Call contracts by their strike in ascending order. Filter them by the specified criteria (Delta/Strike/Price constrains)
       return self.getContracts(contracts
@@ -321,6 +617,7 @@ class StrategyBuilder:
                                , fromPrice = fromPrice
                                , toPrice = toPrice
                                , reverse = False
+                               , limit = limit
                                )
 
 
@@ -342,13 +639,15 @@ class StrategyBuilder:
          currentWings = 0
          # Loop through all contracts
          for contract in contracts[1:]:
+            # Get the distance from the first leg (read the Strike only once)
+            distance = abs(contract.Strike - firstLegStrike)
             # Select the long contract as long as it is within the specified wing size
-            if abs(contract.Strike - firstLegStrike) <= wingSize:
-               currentWings = abs(contract.Strike - firstLegStrike)
+            if distance <= wingSize:
+               currentWings = distance
                wingContract = contract
             else:
                # We have exceeded the wing size, check if the distance to the requested wing size is closer than the contract previously selected
-               if (abs(contract.Strike - firstLegStrike) - wingSize < wingSize - currentWings):
+               if (distance - wingSize < wingSize - currentWings):
                   wingContract = contract
                break
          ### Loop through all contracts
@@ -357,6 +656,25 @@ class StrategyBuilder:
       return wingContract
 
 
+   # Same as getWing, but working on the array of distances of each contract from the first leg (distances[0] = 0, sorted in ascending order).
+   # Returns the position of the wing contract (None if the wing could not be found)
+   def getWingPos(self, distances, wingSize = None):
+      # Make sure the wingSize is specified
+      wingSize = wingSize or 0
+      if len(distances) < 2 or wingSize <= 0:
+         return None
+
+      # Number of contracts (after the first leg) within the specified wing size: the last one is the candidate wing
+      nInside = np.searchsorted(distances[1:], wingSize, side = "right")
+      wingPos = nInside if nInside > 0 else None
+      currentWings = distances[nInside] if nInside > 0 else 0
+      # Check if the first contract beyond the wing size is closer to the requested wing size than the contract previously selected
+      outsidePos = nInside + 1
+      if outsidePos < len(distances) and distances[outsidePos] - wingSize < wingSize - currentWings:
+         wingPos = outsidePos
+      return wingPos
+
+
    # Get Spread contracts (Put or Call)
    def getSpread(self, contracts, type, strike = None, delta = None, wingSize = None, sortByStrike = False):
       # Type is a required parameter
@@ -364,39 +682,94 @@ class StrategyBuilder:
          self.logger.error(f"Input parameter type = {type} is invalid. Valid values: 'Put'|'Call'")
          return
 
+      # Make sure the contracts can be accessed by index
+      if not isinstance(contracts, list):
+         contracts = list(contracts)
+
       type = type.lower()
       if type == "put":
-         # Get all Puts with a strike lower than the given strike and delta lower than the given delta
-         sorted_contracts = self.getPuts(contracts, toDelta = delta, toStrike = strike)
+         # Get all Puts with a strike lower than the given strike and delta lower than the given delta (sorted by descending strike)
+         sortedIdx = self.getContractsIdx(contracts, type = "Put", toDelta = delta, toStrike = strike, reverse = True)
       elif type == "call":
-         # Get all Calls with a strike higher than the given strike and delta lower than the given delta
-         sorted_contracts = self.getCalls(contracts, toDelta = delta, fromStrike = strike)
+         # Get all Calls with a strike higher than the given strike and delta lower than the given delta (sorted by ascending strike)
+         sortedIdx = self.getContractsIdx(contracts, type = "Call", toDelta = delta, fromStrike = strike, reverse = False)
       else:
          self.logger.error(f"Input parameter type = {type} is invalid. Valid values: 'Put'|'Call'")
          return
 
-      # Get the wing
-      wing = self.getWing(sorted_contracts, wingSize = wingSize)
       # Initialize the result
       spread = []
       # Check if we have any contracts
-      if(len(sorted_contracts) > 0):
+      if len(sortedIdx) > 0:
          # Add the first leg
-         spread.append(sorted_contracts[0])
-         if wing != None:
-            # Add the wing
-            spread.append(wing)
-
-      # By default, the legs of a spread are sorted based on their distance from the ATM strike.
-      # - For Call spreads, they are already sorted by increasing strike
-      # - For Put spreads, they are sorted by decreasing strike
-      # In some cases it might be more convenient to return the legs ordersed by their strike (i.e. in case of Iron Condors/Flys)
-      if sortByStrike:
-         spread = sorted(spread, key = lambda x: x.Strike, reverse = False)
+         spread.append(contracts[sortedIdx[0]])
+         # Get the wing, based on the distance of each contract from the first leg
+         strikes = self.chainArrays.strikes[sortedIdx]
+         wingPos = self.getWingPos(np.abs(strikes - strikes[0]), wingSize = wingSize)
+         if wingPos != None:
+            wing = contracts[sortedIdx[wingPos]]
+            # By default, the legs of a spread are sorted based on their distance from the ATM strike.
+            # - For Call spreads, they are already sorted by increasing strike
+            # - For Put spreads, they are sorted by decreasing strike
+            # In some cases it might be more convenient to return the legs ordersed by their strike (i.e. in case of Iron Condors/Flys): 
+            # the strikes are already available in the snapshot, so the wing can be placed directly at the right position
+            if sortByStrike and strikes[wingPos] < strikes[0]:
+               # Add the wing before the first leg
+               spread.insert(0, wing)
+            else:
+               # Add the wing
+               spread.append(wing)
 
       return spread
 
 
+   # Get the legs of a Butterfly (Put or Call), sorted by ascending strike: [leftWing, middle, rightWing]
+   # The middle leg and the first wing (left wing for Puts, right wing for Calls) are selected as a spread. 
+   # The other wing is then found with a binary search on the sorted strikes of the chain snapshot
+   def getButterflyLegs(self, contracts, type, strike = None, delta = None, leftWingSize = None, rightWingSize = None):
+      # Make sure the contracts can be accessed by index (all the queries below must refer to the same chain snapshot)
+      if not isinstance(contracts, list):
+         contracts = list(contracts)
+
+      type = (type or "").lower()
+      if type == "put":
+         # Get the Put spread (sorted by strike in ascending order): [leftWing, middle]
+         spread = self.getSpread(contracts, "Put", strike = strike, delta = delta, wingSize = leftWingSize, sortByStrike = True)
+         # Exit if we couldn't get both legs of the spread
+         if len(spread) != 2:
+            return []
+         # Get the middle strike (second entry in the list)
+         middleStrike = spread[1].Strike
+         # Find the right wing: the Put with the highest strike within the wing size (add a small offset to the fromStrike in order to avoid selecting the middle strike as a wing)
+         wingIdx = self.getChainArrays(contracts).getStrikeRangeIdx(False, middleStrike + 0.1, middleStrike + rightWingSize)
+         # Exit if we could not find the wing
+         if len(wingIdx) == 0:
+            return []
+         # Pick the first contract at the highest strike (same as the first contract returned by getPuts)
+         wingStrikes = self.chainArrays.strikes[wingIdx]
+         wing = contracts[wingIdx[np.searchsorted(wingStrikes, wingStrikes[-1], side = "left")]]
+         # Combine all the legs
+         return spread + [wing]
+      elif type == "call":
+         # Get the Call spread (sorted by strike in ascending order): [middle, rightWing]
+         spread = self.getSpread(contracts, "Call", strike = strike, delta = delta, wingSize = rightWingSize)
+         # Exit if we couldn't get both legs of the spread
+         if len(spread) != 2:
+            return []
+         # Get the middle strike (first entry in the list)
+         middleStrike = spread[0].Strike
+         # Find the left wing: the Call with the lowest strike within the wing size (add a small offset to the toStrike in order to avoid selecting the middle strike as a wing)
+         wingIdx = self.getChainArrays(contracts).getStrikeRangeIdx(True, middleStrike - leftWingSize, middleStrike - 0.1)
+         # Exit if we could not find the wing
+         if len(wingIdx) == 0:
+            return []
+         # Combine all the legs
+         return [contracts[wingIdx[0]]] + spread
+      else:
+         self.logger.error(f"Input parameter type = {type} is invalid. Valid values: 'Put'|'Call'")
+         return []
+
+
    # Get Put Spread contracts
    def getPutSpread(self, contracts, strike = None, delta = None, wingSize = None, sortByStrike = False):
       return self.getSpread(contracts, "Put", strike = strike, delta = delta, wingSize = wingSize, sortByStrike = sortByStrike)
@@ -4,13 +4,40 @@ from AlgorithmImports import *
 
 import fred_data_2000_2006, fred_data_2007_2023
 from io import StringIO
+import numpy as np
 import pandas as pd
 
-fred_csv_data = """
-date,ir
-"""
+# Parse the csv data
+def parseFredData():
+   # Parse each block of data separately (no need to concatenate the two strings into a third one), with the C parser. 
+   # The data blocks have no header: the column names and types are specified explicitly, so there is no need to infer them
+   fredBlocks = [pd.read_csv(StringIO(dataModule.fred_csv_data)
+                             , names = ["date", "ir"]
+                             , header = None
+                             , dtype = {"date": str, "ir": np.float64}
+                             , engine = "c"
+                             )
+                  for dataModule in (fred_data_2000_2006, fred_data_2007_2023)
+                 ]
+   fred = pd.concat(fredBlocks, ignore_index = True, copy = False)
+   # Convert the dates with a fixed format (no format inference)
+   fred["date"] = pd.to_datetime(fred["date"], format = "%Y-%m-%d", cache = True)
+   return fred
 
-fred_csv_data += fred_data_2000_2006.fred_csv_data + fred_data_2007_2023.fred_csv_data
+# Sorts the series by date and returns the dates and the rates as NumPy arrays, used for the lookups by date (see getRiskFreeRate)
+def buildFredArrays(fred):
+   fredOrder = np.argsort(fred["date"].values, kind = "stable")
+   fredDates = fred["date"].values[fredOrder].astype("datetime64[D]")
+   fredRates = fred["ir"].values[fredOrder]
+   return fredDates, fredRates
 
-# Parse the csv data
-fred = pd.read_csv(StringIO(fred_csv_data), parse_dates = ["date"])
+# The rates are looked up by every BSM instance as soon as it is created: build the data when the module is imported
+fred = parseFredData()
+fredDates, fredRates = buildFredArrays(fred)
+
+# Returns the most recent (date, rate) available as of the given date (binary search on the sorted dates), or None if there is no rate before the given date
+def getRiskFreeRate(date):
+   idx = np.searchsorted(fredDates, np.datetime64(date, "D"), side = "right") - 1
+   if idx < 0:
+      return None
+   return fredDates[idx].astype(object), float(fredRates[idx])
@@ -212,6 +212,8 @@ class StrategyBacktest(QCAlgorithm):
       #                                       , sidesDesc = ["Delta50Put", "Delta30Put", "Delta10Put"]
       #                                       , creditStrategy = None
       #                                       ))
+      # Strategies can also be created by their type:
+      # self.strategies.append(createStrategy(self, "IronCondor", name = "IC", putDelta = 10, callDelta = 10, putWingSize = 10, callWingSize = 10, creditStrategy = True))
 
       # Coarse filter for the Universe selection. It selects nStrikes on both sides of the ATM strike for each available expiration
       self.nStrikesLeft = 200
@@ -359,6 +361,10 @@ class StrategyBacktest(QCAlgorithm):
       # Set the timer to monitor the execution performance
       self.executionTimer = Timer(self)
       
+      # Schedule start time (number of seconds since midnight) and schedule frequency (number of minutes), used to check the schedule on every bar
+      self.scheduleStartSeconds = self.scheduleStartTime.hour * 3600 + self.scheduleStartTime.minute * 60 + self.scheduleStartTime.second
+      self.scheduleFrequencyMinutes = round(self.scheduleFrequency.seconds/60)
+      
       # Number of currently active positions
       self.currentActivePositions = 0
       
@@ -396,7 +402,10 @@ class StrategyBacktest(QCAlgorithm):
       underlying.SetDataNormalizationMode(DataNormalizationMode.Raw)
 
       # Keep track of the option contract subscriptions
-      self.optionContractsSubscriptions = []
+      self.optionContractsSubscriptions = set()
+
+      # Cache of the symbols filtered by the OptionChainProvider filter (and their strikes) for the current day
+      self.optionChainProviderCache = (None, None)
 
       # Set Security Initializer
       self.SetSecurityInitializer(self.securityInitializer)
@@ -453,10 +462,20 @@ class StrategyBacktest(QCAlgorithm):
       if len(symbols) == 0: 
          return None
          
-      # Filter the symbols based on the expiry range
-      filteredSymbols = [symbol for symbol in symbols 
-                           if minDte <= (symbol.ID.Date.date() - self.Time.date()).days <= maxDte
-                        ]
+      # The list of symbols only changes once a day: filter the symbols and get the list of strikes only once per day (and DTE range)
+      cacheKey = (self.Time.date(), minDte, maxDte)
+      lastCacheKey, cachedSymbols = self.optionChainProviderCache
+      if cacheKey == lastCacheKey:
+         filteredSymbols, strike_list = cachedSymbols
+      else:
+         # Filter the symbols based on the expiry range
+         filteredSymbols = [symbol for symbol in symbols 
+                              if minDte <= (symbol.ID.Date.date() - self.Time.date()).days <= maxDte
+                           ]
+         # Get the list of available strikes
+         strike_list = sorted(set([i.ID.StrikePrice for i in filteredSymbols]))
+         # Update the cache
+         self.optionChainProviderCache = (cacheKey, (filteredSymbols, strike_list))
 
       # Exit if there are no symbols for the selected expiry range
       if not filteredSymbols: 
@@ -465,13 +484,10 @@ class StrategyBacktest(QCAlgorithm):
       # Get the latest price of the underlying
       underlyingLastPrice = self.Securities[self.underlyingSymbol].Price
 
-      # Find the ATM strike
-      atm_strike = sorted(filteredSymbols
-                          ,key = lambda x: abs(x.ID.StrikePrice - self.Securities[self.underlyingSymbol].Price)
-                          )[0].ID.StrikePrice
-      
-      # Get the list of available strikes
-      strike_list = sorted(set([i.ID.StrikePrice for i in filteredSymbols]))
+      # Find the ATM strike (single pass, no need to sort the whole list)
+      atm_strike = min(filteredSymbols
+                       , key = lambda x: abs(x.ID.StrikePrice - underlyingLastPrice)
+                       ).ID.StrikePrice
       
       # Find the index of ATM strike in the sorted strike list
       atm_strike_rank = strike_list.index(atm_strike)
@@ -492,6 +508,7 @@ class StrategyBacktest(QCAlgorithm):
          # Add this contract to the data subscription so we can retrieve the Bid/Ask price
          if not contract.Symbol in self.optionContractsSubscriptions:
             self.AddOptionContract(contract.Symbol, self.timeResolution)
+            self.optionContractsSubscriptions.add(contract.Symbol)
             
          # Set the BidPrice
          contract.BidPrice = self.Securities[contract.Symbol].BidPrice
@@ -529,7 +546,7 @@ class StrategyBacktest(QCAlgorithm):
       # If no chains were found, use OptionChainProvider to see if we can find any contracts
       # Only do this for short term expiration contracts (DTE < 3) where slice.OptionChains usually fails to retrieve any chains
       # We don't want to do this all the times for performance reasons
-      if contracts == None and self.dte < 3:
+      if contracts is None and self.dte < 3:
          # Get the list of available option Symbols
          symbols = self.OptionChainProvider.GetOptionContractList(self.underlyingSymbol, self.Time)
          # Get the contracts
@@ -544,25 +561,16 @@ class StrategyBacktest(QCAlgorithm):
       # Start the timer
       self.executionTimer.start()
       
-      # Exit if the algorithm is warming up or the market is closed
-      if self.IsWarmingUp or not self.IsMarketOpen(self.underlyingSymbol):
-         return
-      
-      # Compute the schedule start datetime
-      scheduleStartDttm = datetime.combine(self.Time.date(), self.scheduleStartTime)
+      # Get the number of seconds since the schedule start time (integer arithmetic, no datetime objects)
+      currentTime = self.Time
+      secondsSinceScheduleStart = currentTime.hour * 3600 + currentTime.minute * 60 + currentTime.second - self.scheduleStartSeconds
       
-      # Exit if we have not reached the the schedule start datetime
-      if self.Time < scheduleStartDttm:
+      # Exit if we have not reached the the schedule start time or if we are not at the right scheduled interval
+      if secondsSinceScheduleStart < 0 or round(secondsSinceScheduleStart/60) % self.scheduleFrequencyMinutes != 0:
          return
-         
-      # Get the number of minutes since the schedule start time
-      minutesSincescheduleStart = round((self.Time - scheduleStartDttm).seconds/60)
-      
-      # Convert the schedule frequency (timedelta) into a number of minutes
-      scheduleFrequencyMinutes = round(self.scheduleFrequency.seconds/60)
-      
-      # Exit if we are not at the right scheduled interval
-      if minutesSincescheduleStart % scheduleFrequencyMinutes != 0:
+
+      # Exit if the algorithm is warming up or the market is closed
+      if self.IsWarmingUp or not self.IsMarketOpen(self.underlyingSymbol):
          return
 
       # Do not open any new positions if we have reached the maximum
@@ -574,7 +582,7 @@ class StrategyBacktest(QCAlgorithm):
 
 
       # Exit if we got no chains
-      if chain == None:
+      if chain is None:
          self.logger.debug(" -> No chains inside currentSlice!")
          return
 
@@ -589,11 +597,11 @@ class StrategyBacktest(QCAlgorithm):
          # Set the DTE range (make sure values are not negative)
          minDte = max(0, self.dte - self.dteWindow)
          maxDte = max(0, self.dte)
-         # Get the list of expiry dates, sorted in reverse order
-         expiryList = sorted(set([contract.Expiry for contract in chain 
-                                    if minDte <= (contract.Expiry.date() - self.Time.date()).days <= maxDte
-                                  ]
-                                 )
+         # Get the unique expiry dates first (a chain has many contracts for only a few expiry dates), then filter them by DTE
+         today = self.Time.date()
+         expiryList = sorted([expiry for expiry in set(contract.Expiry for contract in chain)
+                                 if minDte <= (expiry.date() - today).days <= maxDte
+                              ]
                              , reverse = True
                              )
          # Add the list to the dictionary
@@ -766,17 +774,29 @@ class MidPriceFillModel(ImmediateFillModel):
 class BetaFillModel(ImmediateFillModel):
 
    # Initialize Random Number generator with a fixed seed (for replicability)
-   random = np.random.RandomState(1234)
+   random = np.random.default_rng(1234)
+   # The random numbers are drawn in batches (one batch for each set of parameters of the Beta distribution)
+   batchSize = 4096
+   betaDraws = {}
    
    def __init__(self, context):
       self.context = context
       
+   # Returns the next random number from the Beta(alpha, beta) distribution, drawing a new batch when the current one is exhausted
+   @classmethod
+   def drawBeta(cls, alpha, beta):
+      draws = cls.betaDraws.get((alpha, beta))
+      value = None if draws == None else next(draws, None)
+      if value == None:
+         draws = iter(cls.random.beta(alpha, beta, size = cls.batchSize).tolist())
+         cls.betaDraws[(alpha, beta)] = draws
+         value = next(draws)
+      return value
+
    def MarketFill(self, asset, order):
       # Start the timer
       self.context.executionTimer.start()
    
-      # Get the random number generator
-      random = BetaFillModel.random
       # Compute the Bid-Ask spread
       bidAskSpread = abs(asset.AskPrice - asset.BidPrice)
       # Compute the Mid-Price
@@ -801,7 +821,7 @@ class BetaFillModel(ImmediateFillModel):
       # Range (width) of the Beta distribution
       range = bidAskSpread/2.0
       # Compute the new fillPrice (centered around the midPrice)
-      fillPrice = round(offset + range * random.beta(alpha, beta), 2)
+      fillPrice = round(offset + range * BetaFillModel.drawBeta(alpha, beta), 2)
       # Update the FillPrice attribute
       fill.FillPrice = fillPrice
       # Stop the timer